@@ -0,0 +1,126 @@
+# 图床代理HTTP客户端基准测试
+"""对比“每次请求新建客户端”（旧实现）与共享连接池客户端的代理延迟
+
+脚本在本地启动一个模拟图床的HTTP/1.1服务（支持keep-alive），
+两种模式各自以相同并发拉取同一张图片，输出吞吐量、延迟分位数以及
+服务端实际建立的TCP连接数。--handshake-ms 在每条新连接的首个请求上
+额外等待，用来模拟到真实图床的TCP+TLS握手往返。
+
+    cd server
+    python benchmarks/bench_http_client.py -n 500 -c 16 --handshake-ms 40
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.http_client import get_http_client, close_http_client  # noqa: E402
+
+# 逐请求的访问日志会干扰计时
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def start_stub_server(payload: bytes, handshake_delay: float):
+    """启动模拟图床，返回 (server, 连接计数器)"""
+    connections = {"count": 0}
+    lock = threading.Lock()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            self._first_request = True
+            with lock:
+                connections["count"] += 1
+
+        def do_GET(self):
+            if self._first_request and handshake_delay:
+                time.sleep(handshake_delay)
+            self._first_request = False
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, connections
+
+
+async def fetch_per_request(url: str):
+    """旧实现：每次请求新建并关闭客户端"""
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        response = await client.get(url)
+        return response.content
+
+
+async def fetch_shared(url: str):
+    """新实现：复用应用级共享客户端"""
+    response = await get_http_client().get(url)
+    return response.content
+
+
+async def run_mode(name, fetch, url, concurrency, total_requests, connections):
+    latencies = []
+    remaining = total_requests
+    connections["count"] = 0
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            await fetch(url)
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"[{name}] 吞吐量: {len(latencies) / elapsed:.1f} 请求/秒, "
+          f"平均: {statistics.mean(latencies) * 1000:.1f}ms, "
+          f"p50: {statistics.median(latencies) * 1000:.1f}ms, p95: {p95 * 1000:.1f}ms, "
+          f"新建连接: {connections['count']}")
+
+
+async def main_async(args):
+    payload = os.urandom(args.size)
+    server, connections = start_stub_server(payload, args.handshake_ms / 1000)
+    url = f"http://127.0.0.1:{server.server_address[1]}/image.jpg"
+    print(f"模拟图床: {url}, 图片大小: {args.size}字节, 模拟握手: {args.handshake_ms}ms")
+    try:
+        await run_mode("每次新建客户端", fetch_per_request, url, args.concurrency, args.requests, connections)
+        await run_mode("共享客户端", fetch_shared, url, args.concurrency, args.requests, connections)
+    finally:
+        await close_http_client()
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图床代理HTTP客户端基准测试")
+    parser.add_argument("-n", "--requests", type=int, default=500, help="每种模式的总请求数")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="并发请求数")
+    parser.add_argument("--size", type=int, default=200 * 1024, help="模拟图片大小（字节）")
+    parser.add_argument("--handshake-ms", type=float, default=0, help="每条新连接额外等待的毫秒数")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
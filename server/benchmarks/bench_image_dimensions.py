@@ -0,0 +1,60 @@
+# 图片尺寸读取基准测试
+"""对比 PIL 读取尺寸（get_image_dimensions）与只解析文件头（probe_image_dimensions）的耗时
+
+默认使用仓库自带的 images/example.jpg，也可以传入其他图片；
+文件头解析只拿到上传时流式读取的第一个分块（UPLOAD_CHUNK_SIZE），与线上一致。
+
+    cd server
+    python benchmarks/bench_image_dimensions.py -n 20000
+    python benchmarks/bench_image_dimensions.py -n 20000 some.png some.webp
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from config import EXAMPLE_IMAGE_PATH, UPLOAD_CHUNK_SIZE  # noqa: E402
+from utils.image_utils import get_image_dimensions, probe_image_dimensions  # noqa: E402
+
+
+def time_per_call(func, arg, iterations: int) -> float:
+    """返回单次调用的平均耗时（微秒）"""
+    func(arg)  # 预热
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(arg)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run(path: str, iterations: int):
+    with open(path, "rb") as f:
+        content = f.read()
+    head = content[:UPLOAD_CHUNK_SIZE]
+
+    probed = probe_image_dimensions(head)
+    expected = get_image_dimensions(content)
+    print(f"{os.path.basename(path)}: {len(content)}字节, PIL: {expected}, 文件头: {probed}")
+    if probed is None:
+        print("  文件头解析失败，线上会回退到PIL（线程池）")
+        return
+    if tuple(probed) != tuple(expected):
+        print("  警告: 两种方式结果不一致")
+
+    pil_us = time_per_call(get_image_dimensions, content, iterations)
+    probe_us = time_per_call(probe_image_dimensions, head, iterations)
+    print(f"  PIL: {pil_us:.2f}us/次, 文件头: {probe_us:.2f}us/次, 加速: {pil_us / probe_us:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片尺寸读取基准测试")
+    parser.add_argument("images", nargs="*", default=[EXAMPLE_IMAGE_PATH], help="图片路径")
+    parser.add_argument("-n", "--iterations", type=int, default=20000, help="每种方式的调用次数")
+    args = parser.parse_args()
+    for path in args.images:
+        run(path, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
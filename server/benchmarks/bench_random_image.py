@@ -0,0 +1,75 @@
+# /image 并发吞吐量基准测试
+"""对运行中的服务并发请求 /image，统计吞吐量和延迟分位数
+
+对比改动前后：分别以同一个数据库启动旧版本与新版本的服务，
+用相同参数各运行一次本脚本即可，例如：
+
+    uvicorn main:app --port 8000            # 旧版本（同步数据库层）
+    python benchmarks/bench_random_image.py --url http://127.0.0.1:8000/image -c 64 -n 5000
+
+    uvicorn main:app --port 8000            # 新版本（异步数据库层）
+    python benchmarks/bench_random_image.py --url http://127.0.0.1:8000/image -c 64 -n 5000
+
+同步数据库层下每次MySQL往返都会阻塞事件循环，并发数增加时吞吐量基本不变、
+延迟线性上升；异步数据库层下吞吐量会随并发数（直到连接池上限）增长。
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def run_benchmark(url: str, concurrency: int, total_requests: int, timeout: float):
+    latencies = []
+    errors = 0
+    remaining = total_requests
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        # 预热，避免把首次建连和ID池加载计入结果
+        await client.get(url)
+
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(f"URL: {url}")
+    print(f"并发数: {concurrency}, 请求数: {len(latencies)}, 失败: {errors}")
+    print(f"总耗时: {elapsed:.2f}秒, 吞吐量: {len(latencies) / elapsed:.1f} 请求/秒")
+    print(f"延迟(ms): 平均 {statistics.mean(latencies) * 1000:.1f}, "
+          f"p50 {percentile(0.50):.1f}, p95 {percentile(0.95):.1f}, p99 {percentile(0.99):.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/image 并发吞吐量基准测试")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/image", help="被测接口地址")
+    parser.add_argument("-c", "--concurrency", type=int, default=32, help="并发请求数")
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="总请求数")
+    parser.add_argument("--timeout", type=float, default=30.0, help="单次请求超时（秒）")
+    args = parser.parse_args()
+
+    asyncio.run(run_benchmark(args.url, args.concurrency, args.requests, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
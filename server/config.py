@@ -30,6 +30,32 @@ ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")  # 请通过环境变
 PICGO_API_URL = os.getenv("PICGO_API_URL", "https://www.picgo.net/api/1/upload")
 PICGO_API_KEY = os.getenv("PICGO_API_KEY", "")  # 请在环境变量中设置您的PicGo API密钥
 
+# ========== 图床HTTP客户端配置 ==========
+# 所有访问图床的请求共用一个客户端，连接保持复用，避免每次重新握手
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))     # 建立连接超时（秒）
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))          # 读取响应超时（秒）
+HTTP_WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", "30"))        # 发送请求体超时（秒）
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "10"))          # 等待空闲连接超时（秒）
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))  # 空闲连接保持时间（秒）
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "True").lower() in ("true", "1", "yes")  # 安装h2后启用HTTP/2
+
+# 上游容错：请求未发出的连接错误总会重试，幂等请求（取图）还会重试写超时、连接中断和5xx；重试间隔为带抖动的指数退避
+UPSTREAM_RETRY_ATTEMPTS = int(os.getenv("UPSTREAM_RETRY_ATTEMPTS", "3"))            # 每次调用最多尝试次数
+UPSTREAM_RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", "0.2"))   # 首次重试的最大等待（秒）
+UPSTREAM_RETRY_MAX_DELAY = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", "2"))       # 单次等待上限（秒）
+UPSTREAM_RETRY_BUDGET = float(os.getenv("UPSTREAM_RETRY_BUDGET", "10"))            # 一次调用累计耗时超过该值后不再重试（秒）
+# 熔断器：连续失败达到阈值后快速失败，经过重置时间后放行探测请求
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+# 图片代理：流式模式下边收边转发上游分块，内存占用与图片大小无关
+PROXY_STREAMING = os.getenv("PROXY_STREAMING", "True").lower() in ("true", "1", "yes")
+PROXY_CHUNK_SIZE = int(os.getenv("PROXY_CHUNK_SIZE", str(64 * 1024)))  # 转发分块大小（字节）
+# 图床图片磁盘缓存的字节预算，超出后按LRU淘汰；设为0关闭缓存
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))  # 默认1GB
+
 # ========== 服务器配置 ==========
 DEBUG = os.getenv("DEBUG", "False").lower() in ("true", "1", "yes")
 SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
@@ -43,16 +69,44 @@ if not DATABASE_URL:
     DB_USER = os.getenv("DB_USER", "root")
     DB_PASSWORD = os.getenv("DB_PASSWORD", "")  # 请设置数据库密码
     DB_NAME = os.getenv("DB_NAME", "meme_db")
-    DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    DATABASE_URL = f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# 数据库层为异步实现：同步驱动的URL自动替换为对应的异步驱动（MySQL用aiomysql，SQLite用aiosqlite）
+ASYNC_DB_DRIVERS = {
+    "mysql+pymysql://": "mysql+aiomysql://",
+    "mysql://": "mysql+aiomysql://",
+    "sqlite://": "sqlite+aiosqlite://",
+}
+for sync_prefix, async_prefix in ASYNC_DB_DRIVERS.items():
+    if DATABASE_URL.startswith(sync_prefix):
+        DATABASE_URL = async_prefix + DATABASE_URL[len(sync_prefix):]
+        break
+
+# 连接池配置（SQLite不使用以下参数）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))              # 常驻连接数
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))        # 超出常驻数后允许临时新建的连接数
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))        # 等待空闲连接的超时（秒）
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))      # 连接最长复用时间（秒），应小于MySQL的wait_timeout
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True").lower() in ("true", "1", "yes")  # 取出连接前先探活
 
 # ========== 文件路径配置 ==========
 # 定义根目录路径和图片目录路径
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 # 图片存储在根目录的images文件夹下
 IMAGES_DIR = os.path.join(ROOT_DIR, "images")
+# 本地图片按内容寻址存放：<哈希1-2位>/<哈希3-4位>/<文件哈希>.<扩展名>，与审核状态无关
+STORAGE_DIR = os.getenv("STORAGE_DIR", os.path.join(IMAGES_DIR, "store"))
+# 旧版本按审核状态分目录存放，已有记录中的路径仍可读取
 CHECKED_DIR = os.path.join(IMAGES_DIR, "checked")
 UNCHECKED_DIR = os.path.join(IMAGES_DIR, "unchecked")
 
+# 图床图片的本地磁盘缓存目录
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(IMAGES_DIR, "cache"))
+# 转码、缩放等派生图片的磁盘缓存目录
+VARIANT_CACHE_DIR = os.getenv("VARIANT_CACHE_DIR", os.path.join(IMAGES_DIR, "variants"))
+# 缩略图目录，按 <规格>/<哈希前两位>/<文件哈希>.webp 存放
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", os.path.join(IMAGES_DIR, "thumbs"))
+
 # 示例图片路径
 EXAMPLE_IMAGE_PATH = os.path.join(IMAGES_DIR, "example.jpg")
 
@@ -62,10 +116,83 @@ ALLOWED_IMAGE_TYPES = ["image/jpeg", "image/png", "image/gif", "image/webp"]
 
 # 文件大小限制（字节）
 MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", str(10 * 1024 * 1024)))  # 默认10MB
+# 上传文件超过该大小时转存到临时文件，单个上传占用的内存不超过此值
+UPLOAD_SPOOL_MAX_SIZE = int(os.getenv("UPLOAD_SPOOL_MAX_SIZE", str(1024 * 1024)))  # 默认1MB
+# 流式读取上传文件（计算哈希、检查大小）时的分块大小
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+# 批量上传单次最多文件数，以及同时向图床上传的文件数
+MAX_BATCH_UPLOAD_FILES = int(os.getenv("MAX_BATCH_UPLOAD_FILES", "10"))
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "4"))
+
+# ========== 后台上传任务配置 ==========
+# background=true 的上传先落盘入库并返回202，由后台worker推送到图床
+UPLOAD_JOB_WORKERS = int(os.getenv("UPLOAD_JOB_WORKERS", "2"))
+# 排队任务上限，队列满时上传返回503
+UPLOAD_JOB_QUEUE_SIZE = int(os.getenv("UPLOAD_JOB_QUEUE_SIZE", "100"))
+# 每个任务最多尝试次数，重试间隔从 UPLOAD_JOB_RETRY_BASE_SECONDS 起指数增长
+UPLOAD_JOB_MAX_ATTEMPTS = int(os.getenv("UPLOAD_JOB_MAX_ATTEMPTS", "4"))
+UPLOAD_JOB_RETRY_BASE_SECONDS = float(os.getenv("UPLOAD_JOB_RETRY_BASE_SECONDS", "2"))
+# 推送中的任务超过该时间（秒）没有新的尝试，启动时视为进程已退出，可由其他进程重新认领
+UPLOAD_JOB_CLAIM_TIMEOUT_SECONDS = int(os.getenv("UPLOAD_JOB_CLAIM_TIMEOUT_SECONDS", "1800"))
+# 内存中保留的已结束任务数
+UPLOAD_JOB_HISTORY_LIMIT = int(os.getenv("UPLOAD_JOB_HISTORY_LIMIT", "1000"))
+
+# ========== 缩略图配置 ==========
+# 缩略图规格，格式为 名称:最长边像素，逗号分隔
+THUMBNAIL_SIZES = {
+    name.strip(): int(side)
+    for name, side in (
+        item.split(":") for item in os.getenv("THUMBNAIL_SIZES", "small:200,medium:400,large:800").split(",") if item.strip()
+    )
+}
+# 管理后台列表 thumb_url 使用的规格
+THUMBNAIL_DEFAULT_SIZE = os.getenv("THUMBNAIL_DEFAULT_SIZE", "medium")
+# 缩略图 WebP 编码质量
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+# 图片解码/缩放进程池的进程数
+IMAGE_PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", "2"))
+
+# ========== 图片转码与缩放配置 ==========
+# /image/checked/{id} 按 Accept 协商返回的转码格式，按优先级排列；当前 Pillow 不支持的格式自动忽略
+IMAGE_VARIANT_FORMATS = [
+    fmt.strip().lower() for fmt in os.getenv("IMAGE_VARIANT_FORMATS", "avif,webp").split(",") if fmt.strip()
+]
+# 转码质量
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "75"))
+# /image/checked/{id}?w= 的宽度档位，请求宽度向上取整到最近的档位，超过最大档位时返回原图
+IMAGE_WIDTH_BUCKETS = sorted(
+    int(width) for width in os.getenv("IMAGE_WIDTH_BUCKETS", "480,960,1440").split(",") if width.strip()
+)
+# 派生图片（转码、缩放）磁盘缓存上限（字节），超出时按LRU淘汰，0为关闭
+VARIANT_CACHE_MAX_BYTES = int(os.getenv("VARIANT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))  # 默认512MB
 
 # ========== 分页配置 ==========
 DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "20"))
 MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "100"))
+# 批量审核单次最多处理的图片数（通过与拒绝合计）
+MAX_REVIEW_BATCH_SIZE = int(os.getenv("MAX_REVIEW_BATCH_SIZE", "500"))
+# 待审核图片计数与数据库对账的间隔（秒），已审核数量随ID池一起对账
+IMAGE_COUNT_RECONCILE_SECONDS = int(os.getenv("IMAGE_COUNT_RECONCILE_SECONDS", "300"))
+
+# ========== 随机图片配置 ==========
+# 已审核图片ID池与数据库对账的间隔（秒）
+CHECKED_POOL_RECONCILE_SECONDS = int(os.getenv("CHECKED_POOL_RECONCILE_SECONDS", "300"))
+# 批量随机接口单次最多返回的图片数
+MAX_RANDOM_BATCH_SIZE = int(os.getenv("MAX_RANDOM_BATCH_SIZE", "20"))
+
+# ========== 近似重复检测配置 ==========
+# 上传时按感知哈希（dHash）查找相似图片：flag 在响应中标出相似图片，reject 直接拒绝，off 关闭
+PHASH_DUP_MODE = os.getenv("PHASH_DUP_MODE", "flag").lower()
+# 汉明距离不超过该值视为近似重复（64位哈希）
+PHASH_DUP_DISTANCE = int(os.getenv("PHASH_DUP_DISTANCE", "6"))
+# 感知哈希索引与数据库对账的间隔（秒）
+PHASH_INDEX_RECONCILE_SECONDS = int(os.getenv("PHASH_INDEX_RECONCILE_SECONDS", "600"))
+# 补算任务（如为已有图片补算感知哈希）每批读取的图片数
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "100"))
+
+# ========== 投票配置 ==========
+# 点赞/点踩先在内存中合并，每隔多少秒批量写回数据库一次
+VOTE_FLUSH_INTERVAL_SECONDS = float(os.getenv("VOTE_FLUSH_INTERVAL_SECONDS", "2"))
 
 # ========== CORS 配置 ==========
 CORS_ORIGINS = [
@@ -1,15 +1,40 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, ForeignKey, DateTime, func
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy import (
+    Column, Integer, String, Boolean, ForeignKey, DateTime, Index, bindparam, delete, func, inspect, or_, select, update
+)
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm.attributes import set_committed_value
 import os
 from datetime import datetime
 
 # 导入配置
-from config import DATABASE_URL
+from config import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+)
+from services.image_counts import unchecked_image_counter
+from services.image_pool import checked_image_pool
+from services.phash_index import phash_index
+from services.pool_metrics import InstrumentedAsyncPool, pool_metrics
+from services.shuffle_deck import ShuffleDeck
 
-# 创建SQLAlchemy引擎和会话
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 创建SQLAlchemy异步引擎和会话，数据库往返不再阻塞事件循环
+# expire_on_commit=False：提交后仍可直接读取对象属性，避免异步上下文中的隐式懒加载
+def _engine_options():
+    """连接池参数；SQLite使用SQLAlchemy默认的连接池"""
+    if DATABASE_URL.startswith("sqlite"):
+        return {}
+    return {
+        "poolclass": InstrumentedAsyncPool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+engine = create_async_engine(DATABASE_URL, **_engine_options())
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 # 图片模型定义
@@ -28,23 +53,67 @@ class Image(Base):
     mime_type = Column(String(50))                            # MIME类型
     width = Column(Integer, default=0)                        # 图片宽度（像素）
     height = Column(Integer, default=0)                       # 图片高度（像素）
+    phash = Column(String(16))                                # 感知哈希（64位dHash的十六进制），用于近似重复检测
+    placeholder = Column(String(1024))                        # 低清占位图（base64 WebP data URI），加载原图前显示
+    dominant_color = Column(String(7))                        # 主色调（#rrggbb）
+    upload_status = Column(String(16), index=True)            # 后台推送到图床的状态：pending/uploading/done/rejected，为空表示无需推送
+    upload_claimed_at = Column(DateTime)                      # 推送任务被某个进程认领（或开始新一次尝试）的时间
+
+    __table_args__ = (
+        # 按审核状态分页时使用的游标索引：WHERE is_checked = ? AND id > ? ORDER BY id
+        Index("ix_images_is_checked_id", "is_checked", "id"),
+    )
 
 # 创建数据库表
-def create_tables():
-    Base.metadata.create_all(bind=engine)
+async def create_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_migrate_existing_table)
+
+# create_all 不会修改已存在的表，旧库升级时在这里补建新增的列（均可为空）和索引
+def _migrate_existing_table(sync_conn):
+    inspector = inspect(sync_conn)
+    table = Image.__table__
+    existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing_columns:
+            column_type = column.type.compile(dialect=sync_conn.dialect)
+            sync_conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+
+    existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing_indexes:
+            index.create(sync_conn)
 
 # 获取数据库会话
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+# 获取连接池的实时状态与获取连接耗时统计
+def get_pool_status():
+    pool = engine.sync_engine.pool
+    status = {"pool_class": type(pool).__name__}
+    if isinstance(pool, InstrumentedAsyncPool):
+        status.update({
+            "pool_size": pool.size(),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "timeout": pool.timeout(),
+            "recycle": DB_POOL_RECYCLE,
+            "pre_ping": DB_POOL_PRE_PING,
+        })
+    status["wait"] = pool_metrics.snapshot()
+    return status
 
 # 添加新图片到数据库
-def add_image(db: Session, file_name: str, file_hash: str, file_path: str,
+async def add_image(db: AsyncSession, file_name: str, file_hash: str, file_path: str,
               image_bed_url: str, is_checked: bool, file_size: int, mime_type: str,
-              width: int, height: int):
+              width: int, height: int, phash: str = None,
+              placeholder: str = None, dominant_color: str = None,
+              upload_status: str = None):
     db_image = Image(
         file_name=file_name,
         file_hash=file_hash,
@@ -54,91 +123,323 @@ def add_image(db: Session, file_name: str, file_hash: str, file_path: str,
         file_size=file_size,
         mime_type=mime_type,
         width=width,
-        height=height
+        height=height,
+        phash=phash,
+        placeholder=placeholder,
+        dominant_color=dominant_color,
+        upload_status=upload_status,
+        # 以 uploading 状态入库表示由当前进程立即推送，视为已认领
+        upload_claimed_at=datetime.now() if upload_status == "uploading" else None
     )
     db.add(db_image)
-    db.commit()
-    db.refresh(db_image)
+    await db.commit()
+    await db.refresh(db_image)
+    sync_checked_status(db_image, was_checked=None)
+    phash_index.add(db_image.id, db_image.phash)
     return db_image
 
 # 根据哈希值查询图片
-def get_image_by_hash(db: Session, file_hash: str):
-    return db.query(Image).filter(Image.file_hash == file_hash).first()
+async def get_image_by_hash(db: AsyncSession, file_hash: str):
+    return await db.scalar(select(Image).where(Image.file_hash == file_hash).limit(1))
 
 # 根据ID获取图片
-def get_image_by_id(db: Session, image_id: int):
-    return db.query(Image).filter(Image.id == image_id).first()
+async def get_image_by_id(db: AsyncSession, image_id: int):
+    return await db.get(Image, image_id)
 
 # 根据文件名获取图片
-def get_image_by_filename(db: Session, filename: str):
-    return db.query(Image).filter(Image.file_name == filename).first()
+async def get_image_by_filename(db: AsyncSession, filename: str):
+    return await db.scalar(select(Image).where(Image.file_name == filename).limit(1))
 
-# 获取随机一张已审核的图片，可以排除当前图片
-def get_random_checked_image(db: Session, current_id: int = None):
-    import random
-    
-    # 构建基础查询
-    query = db.query(Image).filter(Image.is_checked == True)
-    
-    # 如果提供了当前图片ID，排除它
-    if current_id:
-        query = query.filter(Image.id != current_id)
-    
-    # 获取符合条件的图片总数
-    total_count = query.count()
-    
-    # 如果没有符合条件的图片，返回None
-    if total_count == 0:
-        return None
-    
-    # 生成随机偏移量
-    random_offset = random.randint(0, total_count - 1)
-    
-    # 使用偏移量获取随机图片
-    return query.offset(random_offset).first()
+# 查询全部已审核图片的 (id, likes, dislikes)，不读取其它列
+async def get_checked_image_scores(db: AsyncSession):
+    result = await db.execute(
+        select(Image.id, Image.likes, Image.dislikes).where(Image.is_checked == True)
+    )
+    return result.all()
+
+# ID池过期时与数据库对账
+async def refresh_checked_image_pool(db: AsyncSession):
+    if checked_image_pool.needs_reload():
+        checked_image_pool.reload(await get_checked_image_scores(db))
+
+# 获取随机一张已审核的图片，可以排除当前图片；weighted 为真时按点赞/点踩加权
+async def get_random_checked_image(db: AsyncSession, current_id: int = None, weighted: bool = False):
+    await refresh_checked_image_pool(db)
+    pick = checked_image_pool.weighted_random_id if weighted else checked_image_pool.random_id
+
+    # 从ID池随机选取，再按主键获取；若ID已失效（其它进程删除等），移出ID池后重试
+    for _ in range(3):
+        image_id = pick(exclude=current_id)
+        if image_id is None:
+            return None
+        db_image = await get_image_by_id(db, image_id)
+        if db_image and db_image.is_checked:
+            return db_image
+        checked_image_pool.remove(image_id)
+
+    # 连续命中失效ID，说明ID池偏差较大，下次请求强制对账
+    checked_image_pool.invalidate()
+    return None
+
+# 按访客的洗牌牌组获取下一张已审核图片，返回 (图片, 新的牌组令牌)
+async def get_next_deck_image(db: AsyncSession, deck_token: str = "", current_id: int = None):
+    await refresh_checked_image_pool(db)
+    if not len(checked_image_pool):
+        return None, deck_token
+
+    def is_available(image_id: int) -> bool:
+        return image_id in checked_image_pool and image_id != current_id
+
+    deck = ShuffleDeck.decode(deck_token, checked_image_pool.max_id) if deck_token else None
+    if deck is None:
+        deck = ShuffleDeck.new(checked_image_pool.max_id)
+
+    image_id = deck.draw(is_available)
+    if image_id is None and deck.exhausted:
+        # 整副牌已看完，换一副新牌（值域包含期间新增的图片）
+        deck = ShuffleDeck.new(checked_image_pool.max_id)
+        image_id = deck.draw(is_available)
+    if image_id is None:
+        # 连续空位过多时退化为普通随机，牌组位置保留
+        image_id = checked_image_pool.random_id(exclude=current_id)
+        if image_id is None:
+            return None, deck.encode()
+
+    db_image = await get_image_by_id(db, image_id)
+    if not db_image or not db_image.is_checked:
+        checked_image_pool.remove(image_id)
+        return await get_random_checked_image(db, current_id), deck.encode()
+    return db_image, deck.encode()
+
+# 无放回地随机获取多张已审核的图片，可排除一组图片ID
+async def get_random_checked_images(db: AsyncSession, count: int, exclude_ids=()):
+    await refresh_checked_image_pool(db)
+
+    image_ids = checked_image_pool.sample(count, exclude=exclude_ids)
+    if not image_ids:
+        return []
+
+    # 一次主键IN查询取回全部图片，并保持抽样顺序
+    rows = await db.scalars(select(Image).where(Image.id.in_(image_ids)))
+    images = {img.id: img for img in rows}
+    result = []
+    for image_id in image_ids:
+        db_image = images.get(image_id)
+        if db_image and db_image.is_checked:
+            result.append(db_image)
+        else:
+            checked_image_pool.remove(image_id)
+    return result
+
+# 获取所有图片（不按审核状态过滤）
+async def get_all_images(
+    db: AsyncSession, skip: int = 0, limit: int = 100,
+    after_id: int = None, before_id: int = None
+):
+    return await _page_images(db, None, skip, limit, after_id, before_id)
 
 # 获取所有已审核的图片
-def get_all_checked_images(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Image).filter(Image.is_checked == True).offset(skip).limit(limit).all()
+async def get_all_checked_images(
+    db: AsyncSession, skip: int = 0, limit: int = 100,
+    after_id: int = None, before_id: int = None
+):
+    return await _page_images(db, Image.is_checked == True, skip, limit, after_id, before_id)
 
 # 获取所有未审核的图片
-def get_all_unchecked_images(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Image).filter(Image.is_checked == False).offset(skip).limit(limit).all()
+async def get_all_unchecked_images(
+    db: AsyncSession, skip: int = 0, limit: int = 100,
+    after_id: int = None, before_id: int = None
+):
+    return await _page_images(db, Image.is_checked == False, skip, limit, after_id, before_id)
+
+# 按ID升序分页：传入游标（after_id 取其后一页，before_id 取其前一页）时直接在 (is_checked, id) 索引上定位，
+# 任意深度的页代价相同；否则按偏移分页，偏移只在索引上扫描ID，再按ID取整行
+async def _page_images(db: AsyncSession, condition, skip: int, limit: int,
+                       after_id: int = None, before_id: int = None):
+    stmt = select(Image)
+    if condition is not None:
+        stmt = stmt.where(condition)
+
+    if after_id is not None:
+        stmt = stmt.where(Image.id > after_id).order_by(Image.id).limit(limit)
+    elif before_id is not None:
+        stmt = stmt.where(Image.id < before_id).order_by(Image.id.desc()).limit(limit)
+    else:
+        id_page = select(Image.id)
+        if condition is not None:
+            id_page = id_page.where(condition)
+        id_page = id_page.order_by(Image.id).offset(skip).limit(limit).subquery()
+        stmt = select(Image).join(id_page, Image.id == id_page.c.id).order_by(Image.id)
+
+    images = list((await db.scalars(stmt)).all())
+    if after_id is None and before_id is not None:
+        images.reverse()
+    return images
+
+# 统计指定审核状态的图片数量（全表计数，仅用于对账）
+async def count_images(db: AsyncSession, is_checked: bool):
+    return await db.scalar(select(func.count()).select_from(Image).where(Image.is_checked == is_checked))
+
+# 获取已审核/待审核图片数量：已审核数量即ID池大小，待审核数量由计数器维护，过期时才与数据库对账
+async def get_image_counts(db: AsyncSession):
+    await refresh_checked_image_pool(db)
+    if unchecked_image_counter.needs_reload():
+        unchecked_image_counter.reload(await count_images(db, is_checked=False))
+    return {"checked": len(checked_image_pool), "unchecked": unchecked_image_counter.value}
+
+# 图片新增或审核状态变化并提交后，同步ID池与待审核计数；was_checked 为None表示新增的图片
+def sync_checked_status(db_image: Image, was_checked: bool = None):
+    if was_checked == db_image.is_checked:
+        return
+    if db_image.is_checked:
+        checked_image_pool.add(db_image.id, db_image.likes, db_image.dislikes)
+        if was_checked is not None:
+            unchecked_image_counter.adjust(-1)
+    else:
+        checked_image_pool.remove(db_image.id)
+        unchecked_image_counter.adjust(1)
 
 # 更新图片状态为已审核
-def update_image_checked_status(db: Session, image_id: int, is_checked: bool):
-    db_image = db.query(Image).filter(Image.id == image_id).first()
+async def update_image_checked_status(db: AsyncSession, image_id: int, is_checked: bool):
+    db_image = await get_image_by_id(db, image_id)
     if db_image:
+        was_checked = db_image.is_checked
         db_image.is_checked = is_checked
-        db.commit()
-        db.refresh(db_image)
+        await db.commit()
+        await db.refresh(db_image)
+        sync_checked_status(db_image, was_checked)
         return db_image
     return None
 
-# 更新图片点赞数
-def update_image_likes(db: Session, image_id: int, increment: bool = True):
-    db_image = db.query(Image).filter(Image.id == image_id).first()
-    if db_image:
-        if increment:
-            db_image.likes += 1
+# 按ID批量查询图片
+async def get_images_by_ids(db: AsyncSession, image_ids):
+    if not image_ids:
+        return []
+    result = await db.scalars(select(Image).where(Image.id.in_(image_ids)))
+    return result.all()
+
+# 批量审核：approved 中的未审核图片置为已审核，rejected 中的图片删除；
+# 一个事务内用批量UPDATE/DELETE完成，提交后同步ID池、待审核计数和感知哈希索引
+async def apply_review_batch(db: AsyncSession, approved, rejected):
+    table = Image.__table__
+    if approved:
+        await db.execute(update(table).where(table.c.id.in_([img.id for img in approved])).values(is_checked=True))
+    if rejected:
+        await db.execute(delete(table).where(table.c.id.in_([img.id for img in rejected])))
+    await db.commit()
+
+    # 语句绕过了ORM，手动同步已加载对象的属性（不标记为待写回）
+    for db_image in approved:
+        set_committed_value(db_image, "is_checked", True)
+        sync_checked_status(db_image, was_checked=False)
+    for db_image in rejected:
+        phash_index.remove(db_image.id)
+        if db_image.is_checked:
+            checked_image_pool.remove(db_image.id)
         else:
-            # 防止点赞数变成负数
-            db_image.likes = max(0, db_image.likes - 1)
-        db.commit()
-        db.refresh(db_image)
-        return db_image
-    return None
+            unchecked_image_counter.adjust(-1)
+
+# 删除图片记录
+async def delete_image_record(db: AsyncSession, db_image: Image):
+    image_id = db_image.id
+    was_checked = db_image.is_checked
+    await db.delete(db_image)
+    await db.commit()
+    phash_index.remove(image_id)
+    if was_checked:
+        checked_image_pool.remove(image_id)
+    else:
+        unchecked_image_counter.adjust(-1)
 
-# 更新图片点踩数
-def update_image_dislikes(db: Session, image_id: int, increment: bool = True):
-    db_image = db.query(Image).filter(Image.id == image_id).first()
+# 后台上传完成后写入图床URL，图片尺寸未知时一并补上
+async def update_image_bed_url(db: AsyncSession, image_id: int, image_bed_url: str,
+                               width: int = None, height: int = None):
+    db_image = await get_image_by_id(db, image_id)
     if db_image:
-        if increment:
-            db_image.dislikes += 1
-        else:
-            # 防止点踩数变成负数
-            db_image.dislikes = max(0, db_image.dislikes - 1)
-        db.commit()
-        db.refresh(db_image)
+        db_image.image_bed_url = image_bed_url
+        if db_image.upload_status is not None:
+            db_image.upload_status = "done"
+        if width and height and not (db_image.width and db_image.height):
+            db_image.width = width
+            db_image.height = height
+        await db.commit()
         return db_image
-    return None
\ No newline at end of file
+    return None
+
+# 查询一组文件哈希中仍有图片记录引用的哈希
+async def get_referenced_hashes(db: AsyncSession, file_hashes):
+    if not file_hashes:
+        return set()
+    result = await db.scalars(select(Image.file_hash).where(Image.file_hash.in_(file_hashes)))
+    return set(result.all())
+
+# 更新后台推送状态；uploading 同时刷新认领时间，表示推送仍在进行
+async def set_upload_status(db: AsyncSession, image_id: int, status: str):
+    values = {"upload_status": status}
+    if status == "uploading":
+        values["upload_claimed_at"] = datetime.now()
+    await db.execute(update(Image.__table__).where(Image.__table__.c.id == image_id).values(**values))
+    await db.commit()
+
+# 认领待推送到图床的图片：pending 状态，或认领时间早于 stale_before 的 uploading 状态（进程中途退出）
+# 逐行用条件UPDATE认领，多个进程同时启动时每张图片只会被一个进程认领；返回认领到的图片
+async def claim_pending_uploads(db: AsyncSession, stale_before: datetime, limit: int = 100):
+    table = Image.__table__
+    claimable = or_(
+        table.c.upload_status == "pending",
+        (table.c.upload_status == "uploading") & (table.c.upload_claimed_at < stale_before)
+    )
+    candidates = (await db.scalars(select(table.c.id).where(claimable).order_by(table.c.id).limit(limit))).all()
+    claimed_ids = []
+    for image_id in candidates:
+        result = await db.execute(
+            update(table).where(table.c.id == image_id, claimable)
+            .values(upload_status="uploading", upload_claimed_at=datetime.now())
+        )
+        if result.rowcount == 1:
+            claimed_ids.append(image_id)
+    await db.commit()
+    return await get_images_by_ids(db, claimed_ids)
+
+# 感知哈希索引过期时与数据库对账
+async def refresh_phash_index(db: AsyncSession):
+    if phash_index.needs_reload():
+        result = await db.execute(select(Image.id, Image.phash).where(Image.phash.is_not(None)))
+        phash_index.reload(result.all())
+
+# 按感知哈希查找近似重复的图片，返回 [{"id", "distance"}]
+async def find_similar_images(db: AsyncSession, phash: str, max_distance: int, exclude_id: int = None):
+    await refresh_phash_index(db)
+    return phash_index.find_similar(phash, max_distance, exclude=exclude_id)
+
+# 按ID升序分批获取某列为空的图片（补算任务使用）
+async def get_images_missing(db: AsyncSession, column_name: str, after_id: int = 0, limit: int = 100):
+    column = getattr(Image, column_name)
+    result = await db.scalars(
+        select(Image).where(column.is_(None), Image.id > after_id).order_by(Image.id).limit(limit)
+    )
+    return result.all()
+
+# 更新图片的若干列
+async def update_image_fields(db: AsyncSession, image_id: int, **values):
+    await db.execute(update(Image).where(Image.id == image_id).values(**values))
+    await db.commit()
+
+# 批量写回投票增量：deltas 为 {图片ID: [点赞增量, 点踩增量]}，一条UPDATE语句以executemany执行
+async def apply_vote_deltas(db: AsyncSession, deltas):
+    if not deltas:
+        return
+    table = Image.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("b_id"))
+        .values(
+            likes=table.c.likes + bindparam("b_likes"),
+            dislikes=table.c.dislikes + bindparam("b_dislikes"),
+        )
+    )
+    await db.execute(stmt, [
+        {"b_id": image_id, "b_likes": likes, "b_dislikes": dislikes}
+        for image_id, (likes, dislikes) in deltas.items()
+    ])
+    await db.commit()
\ No newline at end of file
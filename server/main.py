@@ -3,13 +3,13 @@ import time
 import uvicorn
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from sqlalchemy import text
 
 # 导入日志配置
 from logger_config import get_logger
 
 # 导入数据库相关模块
-from database import get_db, create_tables
+from database import SessionLocal, create_tables
 
 # 导入路由
 from routers import images, upload, admin
@@ -17,12 +17,25 @@ from routers import images, upload, admin
 # 导入配置和工具
 from config import (
     CORS_ORIGINS, API_TITLE, API_DESCRIPTION, API_VERSION,
-    DEBUG, SERVER_HOST, SERVER_PORT
+    DEBUG, SERVER_HOST, SERVER_PORT, UPLOAD_SPOOL_MAX_SIZE
 )
 from utils.image_utils import ensure_directories, setup_example_image
+from services.http_client import get_http_client, close_http_client
+from services.image_cache import image_cache
+from services.vote_buffer import vote_buffer
+from services.upload_jobs import upload_job_queue
+from services.backfill import stop_backfill_jobs
+from services.thumbnails import thumbnail_service
+from services.image_variants import image_variant_service, variant_cache
+from services.process_pool import shutdown_process_pool
+from starlette.concurrency import run_in_threadpool
+from starlette.formparsers import MultiPartParser
 
 app = FastAPI(title=API_TITLE, description=API_DESCRIPTION, version=API_VERSION)
 
+# 上传文件超过该大小时由表单解析器转存到临时文件
+MultiPartParser.spool_max_size = UPLOAD_SPOOL_MAX_SIZE
+
 # 初始化日志
 logger = get_logger(__name__)
 
@@ -32,23 +45,47 @@ logger = get_logger(__name__)
 async def startup_db_client():
     logger.info("正在启动应用...")
     logger.info("创建数据库表...")
-    create_tables()
+    await create_tables()
     logger.info("确保目录结构存在...")
-    ensure_directories()
+    await run_in_threadpool(ensure_directories)
     logger.info("设置示例图片...")
-    setup_example_image()
+    await run_in_threadpool(setup_example_image)
+    logger.info("加载图片磁盘缓存...")
+    await run_in_threadpool(image_cache.load)
+    await run_in_threadpool(variant_cache.load)
+    logger.info("创建共享HTTP客户端...")
+    get_http_client()
+    logger.info("启动投票写回任务...")
+    vote_buffer.start()
+    logger.info("启动后台上传任务...")
+    upload_job_queue.start()
+    await upload_job_queue.requeue_pending()
     logger.info("应用启动完成")
 
 
+# 在应用关闭时释放共享资源
+@app.on_event("shutdown")
+async def shutdown_client():
+    logger.info("正在关闭应用...")
+    # 写回尚未落库的投票
+    await vote_buffer.stop()
+    await upload_job_queue.stop()
+    await stop_backfill_jobs()
+    await thumbnail_service.stop()
+    await image_variant_service.stop()
+    shutdown_process_pool()
+    await close_http_client()
+    logger.info("应用已关闭")
+
+
 # 健康检查端点
 @app.get("/health")
 async def health_check():
     """健康检查端点，用于监控服务状态"""
     try:
         # 检查数据库连接
-        db = next(get_db())
-        # 简单地尝试获取数据库会话
-        db.close()
+        async with SessionLocal() as db:
+            await db.execute(text("SELECT 1"))
         
         logger.debug("健康检查通过")
         return {
@@ -24,6 +24,12 @@ class AdminLoginResponse(BaseModel):
     token: Optional[str] = None
 
 
+class ReviewBatchRequest(BaseModel):
+    """批量审核请求"""
+    approve: List[int] = []
+    reject: List[int] = []
+
+
 class AdminImageResponse(BaseModel):
     id: int
     file_name: str
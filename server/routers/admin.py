@@ -1,19 +1,34 @@
 # 管理员相关路由
+import asyncio
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 import time
 
 # 导入日志
 from logger_config import get_logger
 
 from database import (
-    get_db, Image, get_all_unchecked_images, get_all_checked_images,
-    update_image_checked_status
+    get_db, Image, get_image_by_id, get_all_unchecked_images, get_all_checked_images,
+    get_image_counts, update_image_checked_status, delete_image_record, get_pool_status,
+    refresh_phash_index, get_images_by_ids, apply_review_batch
+)
+from config import (
+    verify_admin_password, ACCESS_TOKEN_EXPIRE_MINUTES, PHASH_DUP_DISTANCE, THUMBNAIL_DEFAULT_SIZE,
+    MAX_REVIEW_BATCH_SIZE, MAX_PAGE_SIZE
 )
-from config import verify_admin_password, ACCESS_TOKEN_EXPIRE_MINUTES
 from auth import create_access_token, get_current_admin_user
-from models import AdminLoginRequest, AdminLoginResponse
+from models import AdminLoginRequest, AdminLoginResponse, ReviewBatchRequest
+from services.image_cache import image_cache
+from services.vote_buffer import vote_buffer
+from services.upload_jobs import upload_job_queue
+from services.resilience import breaker_stats
+from services.backfill import backfill_jobs
+from services.phash_index import phash_index
+from services.thumbnails import thumbnail_service
+from services.image_variants import image_variant_service
+from services.storage import content_store
 
 router = APIRouter()
 logger = get_logger(__name__)
@@ -42,18 +57,26 @@ async def admin_login(request: AdminLoginRequest):
 
 @router.get("/admin/pending-images")
 async def get_pending_images(
+    after_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
     current_admin: str = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """获取待审核的图片列表，返回包含图床URL的图片信息"""
+    """获取待审核的图片列表，返回包含图床URL的图片信息
+
+    按ID升序返回；传入上次返回的 next_after_id 获取下一批。
+    """
     try:
         logger.debug(f"Admin user: {current_admin}")
-        images = get_all_unchecked_images(db, skip=0, limit=50)  # 增加限制数量
+        images = await get_all_unchecked_images(db, limit=limit, after_id=after_id)
         logger.debug(f"Found {len(images)} unchecked images")
         
-        # 获取总数
-        total = db.query(Image).filter(Image.is_checked == False).count()
+        # 获取总数（内存计数，不做全表COUNT）
+        total = (await get_image_counts(db))["unchecked"]
+        await refresh_phash_index(db)
         logger.debug(f"Total unchecked images: {total}")
+        # 计数叠加尚未写回数据库的投票
+        votes = {img.id: vote_buffer.observe(img.id, img.likes, img.dislikes) for img in images}
         
         result = {
             "images": [
@@ -61,18 +84,24 @@ async def get_pending_images(
                     "id": img.id,
                     "file_name": img.file_name,
                     "is_checked": img.is_checked,
-                    "likes": img.likes,
-                    "dislikes": img.dislikes,
+                    "likes": votes[img.id][0],
+                    "dislikes": votes[img.id][1],
                     "file_size": img.file_size,
                     "image_url": img.image_bed_url if img.image_bed_url and img.image_bed_url.strip() else f"/image/unchecked/{img.id}",
+                    "thumb_url": f"/image/{img.id}/thumb?size={THUMBNAIL_DEFAULT_SIZE}",
+                    "placeholder": img.placeholder,
+                    "dominant_color": img.dominant_color,
                     "source": "picgo" if img.image_bed_url and img.image_bed_url.strip() else "local",
                     "width": getattr(img, 'width', 0),
                     "height": getattr(img, 'height', 0),
-                    "created_at": img.upload_time.isoformat() if hasattr(img, 'upload_time') and img.upload_time else None
+                    "created_at": img.upload_time.isoformat() if hasattr(img, 'upload_time') and img.upload_time else None,
+                    # 近似重复的已有图片，供审核时参考
+                    "similar_images": phash_index.find_similar(img.phash, PHASH_DUP_DISTANCE, exclude=img.id) if img.phash else []
                 } for img in images
             ],
             "total": total,
-            "returned": len(images)
+            "returned": len(images),
+            "next_after_id": images[-1].id if len(images) == limit else None
         }
         logger.debug(f"Returning {len(result['images'])} pending images")
         return result
@@ -85,32 +114,45 @@ async def get_pending_images(
 
 @router.get("/admin/checked-images")
 async def get_checked_images(
-    page: int = 1,
-    page_size: int = 5,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(5, ge=1, le=MAX_PAGE_SIZE),
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
     current_admin: str = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """获取已审核图片列表（分页），返回包含图床URL的图片信息"""
+    """获取已审核图片列表（分页），返回包含图床URL的图片信息
+
+    翻到相邻页时传入游标：下一页用 after_id=next_after_id，上一页用 before_id=prev_before_id，
+    查询直接在 (is_checked, id) 索引上定位；只传 page 时按偏移跳页。
+    """
     start_time = time.time()
-    # 计算跳过的记录数
+    # 计算跳过的记录数（仅在没有游标时使用）
     skip = (page - 1) * page_size
-    images = get_all_checked_images(db, skip=skip, limit=page_size)
+    images = await get_all_checked_images(
+        db, skip=skip, limit=page_size, after_id=after_id, before_id=before_id
+    )
     
-    # 获取总数
-    total = db.query(Image).filter(Image.is_checked == True).count()
+    # 获取总数（即已审核图片ID池大小，不做全表COUNT）
+    total = (await get_image_counts(db))["checked"]
     total_pages = (total + page_size - 1) // page_size
     end_time = time.time()
     logger.debug(f"Fetched checked images in {end_time - start_time:.2f} seconds")
+    # 计数叠加尚未写回数据库的投票
+    votes = {img.id: vote_buffer.observe(img.id, img.likes, img.dislikes) for img in images}
     return {
         "images": [
             {
                 "id": img.id,
                 "file_name": img.file_name,
                 "is_checked": img.is_checked,
-                "likes": img.likes,
-                "dislikes": img.dislikes,
+                "likes": votes[img.id][0],
+                "dislikes": votes[img.id][1],
                 "file_size": img.file_size,
                 "image_url": img.image_bed_url if img.image_bed_url and img.image_bed_url.strip() else f"/image/checked/{img.id}",
+                "thumb_url": f"/image/{img.id}/thumb?size={THUMBNAIL_DEFAULT_SIZE}",
+                "placeholder": img.placeholder,
+                "dominant_color": img.dominant_color,
                 "source": "picgo" if img.image_bed_url and img.image_bed_url.strip() else "local",
                 "width": getattr(img, 'width', 0),
                 "height": getattr(img, 'height', 0),
@@ -120,7 +162,9 @@ async def get_checked_images(
         "total": total,
         "current_page": page,
         "total_pages": total_pages,
-        "page_size": page_size
+        "page_size": page_size,
+        "next_after_id": images[-1].id if images else None,
+        "prev_before_id": images[0].id if images else None
     }
 
 
@@ -129,7 +173,7 @@ async def review_image(
     image_id: int,
     action: str,  # "approve" 或 "reject"
     current_admin: str = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """管理员审核图片"""
     if action not in ["approve", "reject"]:
@@ -137,38 +181,147 @@ async def review_image(
     
     if action == "approve":
         # 批准图片
-        result = update_image_checked_status(db, image_id, True)
+        result = await update_image_checked_status(db, image_id, True)
         if not result:
             raise HTTPException(status_code=404, detail="图片未找到")
+        thumbnail_service.schedule_ensure(result)
         
         return {"message": "图片已批准", "action": "approved"}
     
     elif action == "reject":
         # 拒绝图片（删除）
-        db_image = db.query(Image).filter(Image.id == image_id).first()
+        db_image = await get_image_by_id(db, image_id)
         if not db_image:
             raise HTTPException(status_code=404, detail="图片未找到")
         
-        # 删除数据库记录（不再删除本地文件，因为使用图床）
-        db.delete(db_image)
-        db.commit()
+        # 删除数据库记录，再清理不再被引用的本地文件
+        await delete_image_record(db, db_image)
+        vote_buffer.forget(image_id)
+        await content_store.release(db, [db_image])
+        await thumbnail_service.remove(db_image.file_hash)
+        await image_variant_service.remove(db_image.file_hash)
         
         return {"message": "图片已拒绝并删除", "action": "rejected"}
 
 
+@router.post("/admin/review-batch")
+async def review_batch(
+    request: ReviewBatchRequest,
+    current_admin: str = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """批量审核：approve 中的图片通过，reject 中的图片删除，一个事务内完成
+
+    返回每个ID的处理结果：approved / already_approved / rejected / not_found。
+    """
+    approve_ids = list(dict.fromkeys(request.approve))
+    reject_ids = list(dict.fromkeys(request.reject))
+    if set(approve_ids) & set(reject_ids):
+        raise HTTPException(status_code=400, detail="同一张图片不能同时通过和拒绝")
+    if len(approve_ids) + len(reject_ids) > MAX_REVIEW_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"单次最多审核 {MAX_REVIEW_BATCH_SIZE} 张图片")
+
+    # 一次查询取出全部图片
+    images = {img.id: img for img in await get_images_by_ids(db, approve_ids + reject_ids)}
+    to_approve = [images[i] for i in approve_ids if i in images and not images[i].is_checked]
+    to_reject = [images[i] for i in reject_ids if i in images]
+
+    # 本地文件按内容寻址存放，审核只更新数据库
+    await apply_review_batch(db, to_approve, to_reject)
+
+    for img in to_reject:
+        vote_buffer.forget(img.id)
+    for img in to_approve:
+        thumbnail_service.schedule_ensure(img)
+    await asyncio.gather(*(thumbnail_service.remove(img.file_hash) for img in to_reject))
+    await asyncio.gather(*(image_variant_service.remove(img.file_hash) for img in to_reject))
+    # 事务提交后删除被拒绝图片的存储文件
+    await content_store.release(db, to_reject)
+
+    results = []
+    for image_id in approve_ids:
+        if image_id not in images:
+            status = "not_found"
+        else:
+            status = "approved" if images[image_id] in to_approve else "already_approved"
+        results.append({"id": image_id, "action": "approve", "status": status})
+    for image_id in reject_ids:
+        results.append({"id": image_id, "action": "reject", "status": "rejected" if image_id in images else "not_found"})
+
+    return {
+        "approved": len(to_approve),
+        "rejected": len(to_reject),
+        "results": results
+    }
+
+
 @router.delete("/admin/image/{image_id}")
 async def delete_image(
     image_id: int,
     current_admin: str = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """删除指定图片"""
-    db_image = db.query(Image).filter(Image.id == image_id).first()
+    db_image = await get_image_by_id(db, image_id)
     if not db_image:
         raise HTTPException(status_code=404, detail="图片未找到")
     
-    # 删除数据库记录（不再删除本地文件，因为使用图床）
-    db.delete(db_image)
-    db.commit()
+    # 删除数据库记录，再清理不再被引用的本地文件
+    await delete_image_record(db, db_image)
+    vote_buffer.forget(image_id)
+    await content_store.release(db, [db_image])
+    await thumbnail_service.remove(db_image.file_hash)
+    await image_variant_service.remove(db_image.file_hash)
     
     return {"message": "图片已删除", "id": image_id}
+
+
+@router.get("/admin/stats/db-pool")
+async def get_db_pool_stats(current_admin: str = Depends(get_current_admin_user)):
+    """获取数据库连接池的实时占用、溢出和获取连接耗时统计"""
+    return get_pool_status()
+
+
+@router.get("/admin/stats/image-cache")
+async def get_image_cache_stats(current_admin: str = Depends(get_current_admin_user)):
+    """获取图片磁盘缓存的命中、未命中和淘汰统计"""
+    return image_cache.stats()
+
+
+@router.get("/admin/stats/image-variants")
+async def get_image_variant_stats(current_admin: str = Depends(get_current_admin_user)):
+    """获取 AVIF/WebP 转码数量与派生图片缓存统计"""
+    return image_variant_service.stats()
+
+
+@router.get("/admin/stats/upload-jobs")
+async def get_upload_job_stats(current_admin: str = Depends(get_current_admin_user)):
+    """获取后台上传任务队列的排队数量与各状态任务数"""
+    return upload_job_queue.stats()
+
+
+@router.get("/admin/stats/upstream")
+async def get_upstream_stats(current_admin: str = Depends(get_current_admin_user)):
+    """获取PicGo接口与图床访问的熔断器状态和失败统计"""
+    return breaker_stats()
+
+
+def _get_backfill_job(name: str):
+    job = backfill_jobs.get(name)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"未知的补算任务，可选: {', '.join(backfill_jobs)}")
+    return job
+
+
+@router.post("/admin/backfill/{name}", status_code=202)
+async def start_backfill(name: str, current_admin: str = Depends(get_current_admin_user)):
+    """启动补算任务（如 phash：为已有图片补算感知哈希），已在运行时返回当前进度"""
+    job = _get_backfill_job(name)
+    started = job.start()
+    return {"started": started, **job.status()}
+
+
+@router.get("/admin/backfill/{name}")
+async def get_backfill_status(name: str, current_admin: str = Depends(get_current_admin_user)):
+    """查询补算任务进度"""
+    return _get_backfill_job(name).status()
@@ -1,69 +1,232 @@
 # 图片相关路由
-import os
 import time
-import httpx
-from fastapi import APIRouter, Depends, HTTPException, Response
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+import aiofiles.os
+from starlette.background import BackgroundTask
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 
 # 导入日志
 from logger_config import get_logger
 
 from database import (
-    get_db, Image, get_random_checked_image, get_all_checked_images, 
-    get_all_unchecked_images, update_image_likes, update_image_dislikes,
-    update_image_checked_status
+    get_db, Image, get_image_by_id, get_image_by_filename, get_all_images,
+    get_random_checked_image, get_random_checked_images, get_next_deck_image,
+    get_all_checked_images, get_all_unchecked_images,
+    update_image_checked_status, sync_checked_status
 )
 from models import ImageInfo
-from config import CHECKED_DIR, UNCHECKED_DIR
-import shutil
+from services.http_client import get_http_client
+from services.resilience import CircuitOpenError, image_bed_breaker, resilient_request
+from services.image_cache import image_cache
+from services.vote_buffer import vote_buffer
+from services.thumbnails import thumbnail_service
+from services.image_variants import image_variant_service
+from utils.http_utils import etag_matches, file_etag, local_file_response, not_modified_response
+from config import (
+    MAX_RANDOM_BATCH_SIZE, MAX_PAGE_SIZE, PROXY_STREAMING, PROXY_CHUNK_SIZE,
+    THUMBNAIL_SIZES, THUMBNAIL_DEFAULT_SIZE
+)
 
 router = APIRouter()
 logger = get_logger(__name__)
 
 
+# 代理图床响应时原样转发的响应头
+PROXY_FORWARD_HEADERS = ("content-length", "content-encoding", "etag", "last-modified")
+
+
+async def _proxy_from_image_bed(
+    image_url: str,
+    headers: dict,
+    cache_key: Optional[str] = None
+) -> Optional[Response]:
+    """通过共享客户端代理图床图片，失败时返回None由调用方走本地后备
+
+    流式模式下收到上游响应头后立即开始转发，逐块透传原始字节，
+    每个请求占用的内存只有一个分块大小；否则整张图片读入内存后再返回。
+    提供 cache_key 时同时把图片写入磁盘缓存。
+    """
+    client = get_http_client()
+    try:
+        if not PROXY_STREAMING:
+            response = await resilient_request(image_bed_breaker, lambda: client.get(image_url), idempotent=True)
+            if response.status_code != 200:
+                logger.warning(f"图床返回错误状态码: {response.status_code}")
+                return None
+            if cache_key:
+                try:
+                    await image_cache.put(cache_key, response.content)
+                except OSError as e:
+                    logger.error(f"写入图片缓存失败: {e}")
+            content_type = response.headers.get('content-type', 'image/jpeg')
+            return Response(content=response.content, media_type=content_type, headers=headers)
+
+        upstream = await resilient_request(
+            image_bed_breaker,
+            lambda: client.send(client.build_request("GET", image_url), stream=True),
+            idempotent=True
+        )
+    except CircuitOpenError as e:
+        # 熔断期间不再等待上游超时，直接走本地后备
+        logger.debug(f"跳过图床请求: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"从图床获取图片失败: {e}")
+        return None
+
+    if upstream.status_code != 200:
+        logger.warning(f"图床返回错误状态码: {upstream.status_code}")
+        await upstream.aclose()
+        return None
+
+    # 已有基于文件哈希的ETag时不使用上游的ETag
+    for name in PROXY_FORWARD_HEADERS:
+        if name in upstream.headers and name not in headers:
+            headers[name] = upstream.headers[name]
+
+    # 只缓存未经压缩编码的原始图片，带 Content-Length 时还要求不超过缓存预算
+    expected_size = upstream.headers.get("content-length")
+    cacheable = (
+        cache_key is not None
+        and "content-encoding" not in upstream.headers
+        and (expected_size is None or int(expected_size) <= image_cache.max_bytes)
+    )
+
+    async def relay():
+        writer = None
+        completed = False
+        try:
+            if cacheable:
+                writer = await image_cache.open_writer(cache_key)
+            async for chunk in upstream.aiter_raw(PROXY_CHUNK_SIZE):
+                if writer:
+                    await writer.write(chunk)
+                yield chunk
+            completed = expected_size is None or writer is None or writer.size == int(expected_size)
+        except Exception as e:
+            # 响应头已发出，只能中断连接；客户端会收到不完整的响应
+            logger.error(f"转发图床图片中断: {e}")
+            raise
+        finally:
+            # 客户端断开（GeneratorExit / CancelledError）时也会走到这里：只有完整读完才写入缓存
+            if writer:
+                if completed:
+                    await writer.commit()
+                else:
+                    await writer.abort()
+            await upstream.aclose()
+
+    return StreamingResponse(
+        relay(),
+        media_type=upstream.headers.get('content-type', 'image/jpeg'),
+        headers=headers,
+        background=BackgroundTask(upstream.aclose)
+    )
+
+
+def _raise_if_image_bed_failed(db_image: Image, upstream_only: bool = True):
+    """图片只在图床上、而取图失败时报错：图床熔断中返回503，其他上游错误返回502
+
+    upstream_only 为False时失败也可能来自其他环节（如缩略图解码），只处理熔断的情况。
+    """
+    image_url = (db_image.image_bed_url or "").strip()
+    if not image_url.startswith(("http://", "https://")):
+        return
+    if image_bed_breaker.is_open:
+        raise HTTPException(
+            status_code=503,
+            detail="图床暂时不可用，请稍后重试",
+            headers={"Retry-After": str(max(int(image_bed_breaker.retry_after()), 1))}
+        )
+    if upstream_only:
+        raise HTTPException(status_code=502, detail="从图床获取图片失败")
+
+
+def _random_image_payload(db_image: Image) -> dict:
+    """构建随机图片接口返回的图片信息，优先使用图床URL"""
+    image_url = db_image.image_bed_url
+    if not image_url or not image_url.strip():
+        image_url = f"/image/checked/{db_image.id}"
+
+    # 计数叠加尚未写回数据库的投票
+    likes, dislikes = vote_buffer.observe(db_image.id, db_image.likes, db_image.dislikes)
+    return {
+        "id": db_image.id,
+        "file_name": db_image.file_name,
+        "image_url": image_url,
+        "likes": likes,
+        "dislikes": dislikes,
+        "size": db_image.file_size,
+        "width": db_image.width if db_image.width else None,
+        "height": db_image.height if db_image.height else None,
+        # 原图加载完成前显示的低清占位图和主色调
+        "placeholder": db_image.placeholder,
+        "dominant_color": db_image.dominant_color,
+        # 按宽度缩小的版本，供前端拼接 srcset
+        "srcset": image_variant_service.srcset(db_image, image_url)
+    }
+
+
 @router.get("/image-info")
-async def get_image_info(current: str = "", db: Session = Depends(get_db)):
+async def get_image_info(current: str = "", db: AsyncSession = Depends(get_db)):
     """获取图片信息，返回图片URL而不是二进制数据"""
     current_id = None
 
     if current:
-        current_image = db.query(Image).filter(Image.file_name == current).first()
+        current_image = await get_image_by_filename(db, current)
         if current_image:
             current_id = current_image.id
 
-    db_image = get_random_checked_image(db, current_id)
+    db_image = await get_random_checked_image(db, current_id)
 
     if not db_image:
         raise HTTPException(status_code=404, detail="没有可用的图片")
 
     # 返回图片信息，包括图床URL
+    likes, dislikes = vote_buffer.observe(db_image.id, db_image.likes, db_image.dislikes)
     return {
         "id": db_image.id,
         "file_name": db_image.file_name,
         "image_url": db_image.image_bed_url if db_image.image_bed_url else None,
-        "likes": db_image.likes,
-        "dislikes": db_image.dislikes
+        "likes": likes,
+        "dislikes": dislikes
     }
 
 
 @router.get("/image")
-async def fetch_random_image(current: str = "", db: Session = Depends(get_db)):
-    """从数据库随机获取一张已审核的图片，返回图片信息和图床URL"""
+async def fetch_random_image(
+    current: str = "",
+    deck: str = "",
+    weighting: str = "",
+    db: AsyncSession = Depends(get_db)
+):
+    """从数据库随机获取一张已审核的图片，返回图片信息和图床URL
+
+    响应中的 deck 为洗牌牌组令牌，下次请求原样带回即可在看完全部图片前不重复。
+    weighting=score 时按点赞/点踩加权抽样（不使用牌组）。
+    """
+    if weighting not in ("", "uniform", "score"):
+        raise HTTPException(status_code=400, detail="weighting 只支持 'uniform' 或 'score'")
+
     # 开始计时
     start_time = time.time()
     current_id = None
 
     # 如果提供了当前图片名称，获取其ID
     if current:
-        current_image = db.query(Image).filter(
-            Image.file_name == current
-        ).first()
+        current_image = await get_image_by_filename(db, current)
         if current_image:
             current_id = current_image.id
 
-    # 从数据库获取随机图片
-    db_image = get_random_checked_image(db, current_id)    # 如果数据库中没有已审核的图片，返回404
+    if weighting == "score":
+        # 按得分加权抽样，牌组令牌原样返回
+        db_image, next_deck = await get_random_checked_image(db, current_id, weighted=True), deck
+    else:
+        # 按牌组获取下一张图片
+        db_image, next_deck = await get_next_deck_image(db, deck, current_id)
+    # 如果数据库中没有已审核的图片，返回404
     if not db_image:
         # 计算耗时并记录
         end_time = time.time()
@@ -77,242 +240,301 @@ async def fetch_random_image(current: str = "", db: Session = Depends(get_db)):
     logger.debug(f"成功获取随机图片信息 - 图片ID: {db_image.id}, "
           f"文件名: {db_image.file_name}, 执行时间: {execution_time:.3f}秒")
 
-    # 返回图片信息，优先使用图床URL
-    image_url = db_image.image_bed_url
-    if not image_url or not image_url.strip():
-        image_url = f"/image/checked/{db_image.id}"
+    payload = _random_image_payload(db_image)
+    payload["deck"] = next_deck
+    return payload
+
+
+@router.get("/images/random")
+async def fetch_random_images(n: int = 5, exclude: str = "", db: AsyncSession = Depends(get_db)):
+    """一次返回 n 张互不相同的随机已审核图片，exclude 为逗号分隔的图片ID"""
+    if n < 1:
+        raise HTTPException(status_code=400, detail="n 必须大于 0")
+    n = min(n, MAX_RANDOM_BATCH_SIZE)
+
+    try:
+        exclude_ids = {int(item) for item in exclude.split(",") if item.strip()}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="exclude 必须是逗号分隔的图片ID")
+
+    images = await get_random_checked_images(db, n, exclude_ids)
+    if not images:
+        raise HTTPException(status_code=404, detail="没有可用的图片")
 
     return {
-        "id": db_image.id,
-        "file_name": db_image.file_name,
-        "image_url": image_url,
-        "likes": db_image.likes,
-        "dislikes": db_image.dislikes,
-        "size": db_image.file_size,
-        "width": db_image.width if db_image.width else None,
-        "height": db_image.height if db_image.height else None
+        "images": [_random_image_payload(img) for img in images],
+        "returned": len(images)
     }
 
 
 @router.get("/image/checked/{image_id}")
-async def fetch_checked_image(image_id: int, db: Session = Depends(get_db)):
-    """从数据库中获取指定ID的已审核图片，通过后端代理获取图片内容"""
-    db_image = db.query(Image).filter(Image.id == image_id, Image.is_checked == True).first()
+async def fetch_checked_image(
+    image_id: int,
+    request: Request,
+    w: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """从数据库中获取指定ID的已审核图片，通过后端代理获取图片内容
 
-    if not db_image:
+    w 为期望宽度，向上取整到 IMAGE_WIDTH_BUCKETS 中的档位后返回缩小的版本（不放大）。
+    """
+    if w is not None and w <= 0:
+        raise HTTPException(status_code=400, detail="w 必须大于 0")
+    db_image = await get_image_by_id(db, image_id)
+
+    if not db_image or not db_image.is_checked:
         raise HTTPException(status_code=404, detail="未找到该ID的审核图片")
 
     # 调试信息：记录图片信息
     logger.debug(f"获取到图片 - ID: {db_image.id}, 文件名: {db_image.file_name}")
     logger.debug(f"图床URL: '{db_image.image_bed_url}'")
     logger.debug(f"本地路径: '{db_image.file_path}'")
+
+    likes, dislikes = vote_buffer.observe(db_image.id, db_image.likes, db_image.dislikes)
+    headers = {
+        "X-Image-Name": db_image.file_name,
+        "X-Image-ID": str(db_image.id),
+        "X-Image-Likes": str(likes),
+        "X-Image-Dislikes": str(dislikes),
+        "Cache-Control": "public, max-age=3600"
+    }
+
+    # 响应随 Accept 变化时，304 也要带上 Vary
+    if image_variant_service.varies(db_image.mime_type):
+        headers["Vary"] = "Accept"
+
+    # 客户端已有同一哈希的图片时直接返回304，不访问图床和磁盘
+    etag = file_etag(db_image.file_hash)
+    if etag_matches(request, etag):
+        return not_modified_response(etag, headers)
+    if etag:
+        headers["etag"] = etag
+
+    # 客户端支持时返回 AVIF/WebP 转码结果；未生成时本次返回原图，后台开始转码
+    variant_formats = image_variant_service.negotiate(request, db_image.mime_type)
+    # 按宽度档位缩小的版本当场生成，同一档位的并发请求只生成一次
+    if w is not None:
+        variant = await image_variant_service.resized(db_image, w, variant_formats)
+        if variant:
+            headers["X-Image-Variant"] = f"w{variant['width']}.{variant['format']}"
+            return await local_file_response(
+                request, variant["path"], variant["media_type"],
+                f"{db_image.file_hash}-w{variant['width']}-{variant['format']}", headers
+            )
+    if variant_formats:
+        variant = await image_variant_service.lookup(db_image, variant_formats)
+        if variant:
+            headers["X-Image-Variant"] = variant["format"]
+            return await local_file_response(
+                request, variant["path"], variant["media_type"], f"{db_image.file_hash}-{variant['format']}", headers
+            )
     
     # 如果有PicGo图床URL，通过后端代理获取图片
     if db_image.image_bed_url and db_image.image_bed_url.strip():
         image_url = db_image.image_bed_url.strip()
         
         if image_url.startswith(('http://', 'https://')):
-            try:
-                # 通过后端代理获取图片内容
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.get(image_url)
-                    
-                    if response.status_code == 200:
-                        # 获取图片内容类型
-                        content_type = response.headers.get('content-type', 'image/jpeg')
-                        # 返回图片内容
-                        headers = {
-                            "X-Image-Name": db_image.file_name,
-                            "X-Image-ID": str(db_image.id),
-                            "X-Image-Likes": str(db_image.likes),
-                            "X-Image-Dislikes": str(db_image.dislikes),
-                            "Cache-Control": "public, max-age=3600"
-                        }
-                        
-                        return Response(
-                            content=response.content,
-                            media_type=content_type,
-                            headers=headers
-                        )
-                    else:
-                        logger.warning(f"图床返回错误状态码: {response.status_code}")
-                        
-            except Exception as e:
-                logger.error(f"从图床获取图片失败: {e}")
+            # 优先从磁盘缓存返回
+            cache_key = db_image.file_hash if image_cache.enabled else None
+            if cache_key:
+                cached_path = image_cache.get(cache_key)
+                if cached_path and await aiofiles.os.path.exists(cached_path):
+                    headers["X-Cache"] = "HIT"
+                    return await local_file_response(
+                        request, cached_path, db_image.mime_type or "image/jpeg", db_image.file_hash, headers
+                    )
+                if cached_path:
+                    image_cache.discard(cache_key)
+                headers["X-Cache"] = "MISS"
+
+            # 通过后端代理获取图片内容
+            response = await _proxy_from_image_bed(image_url, headers, cache_key)
+            if response:
+                return response
 
     # 如果没有图床URL但有本地文件路径，作为后备方案
-    if db_image.file_path and os.path.exists(db_image.file_path):
-        with open(db_image.file_path, "rb") as image_file:
-            content = image_file.read()
-        
-        media_type = db_image.mime_type
-        headers = {
-            "X-Image-Name": db_image.file_name,
-            "X-Image-ID": str(db_image.id),
-            "X-Image-Likes": str(db_image.likes),
-            "X-Image-Dislikes": str(db_image.dislikes)
-        }
-        return Response(content=content, media_type=media_type, headers=headers)
+    if db_image.file_path and await aiofiles.os.path.exists(db_image.file_path):
+        headers.pop("X-Cache", None)
+        return await local_file_response(
+            request, db_image.file_path, db_image.mime_type, db_image.file_hash, headers
+        )
     
+    # 图床取图失败且没有本地副本时返回503（熔断中）或502
+    _raise_if_image_bed_failed(db_image)
     # 如果既没有图床URL也没有本地文件，返回404
     raise HTTPException(status_code=404, detail="图片文件不可用")
 
 
 @router.get("/image/unchecked/{image_id}")
-async def fetch_unchecked_image(image_id: int, db: Session = Depends(get_db)):
+async def fetch_unchecked_image(image_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """从数据库中获取指定ID的未审核图片，通过后端代理获取图片内容"""
-    db_image = db.query(Image).filter(Image.id == image_id, Image.is_checked == False).first()
+    db_image = await get_image_by_id(db, image_id)
     
-    if not db_image:
+    if not db_image or db_image.is_checked:
         raise HTTPException(status_code=404, detail="未找到该ID的未审核图片")
+
+    headers = {
+        "X-Image-Name": db_image.file_name,
+        "X-Image-ID": str(db_image.id),
+        "Cache-Control": "public, max-age=3600"
+    }
+
+    # 客户端已有同一哈希的图片时直接返回304
+    etag = file_etag(db_image.file_hash)
+    if etag_matches(request, etag):
+        return not_modified_response(etag, headers)
+    if etag:
+        headers["etag"] = etag
     
     # 如果有PicGo图床URL，通过后端代理获取图片
     if db_image.image_bed_url and db_image.image_bed_url.strip():
         image_url = db_image.image_bed_url.strip()
         
         if image_url.startswith(('http://', 'https://')):
-            try:
-                # 通过后端代理获取图片内容
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.get(image_url)
-                    
-                    if response.status_code == 200:
-                        # 获取图片内容类型
-                        content_type = response.headers.get('content-type', 'image/jpeg')
-                        # 返回图片内容
-                        headers = {
-                            "X-Image-Name": db_image.file_name,
-                            "X-Image-ID": str(db_image.id),
-                            "Cache-Control": "public, max-age=3600"
-                        }
-                        return Response(
-                            content=response.content,
-                            media_type=content_type,
-                            headers=headers
-                        )
-                    else:
-                        logger.warning(f"图床返回错误状态码: {response.status_code}")
-                        
-            except Exception as e:
-                logger.error(f"从图床获取图片失败: {e}")
+            # 通过后端代理获取图片内容
+            response = await _proxy_from_image_bed(image_url, headers)
+            if response:
+                return response
     
     # 如果没有图床URL但有本地文件路径，作为后备方案
-    if db_image.file_path and os.path.exists(db_image.file_path):
-        with open(db_image.file_path, "rb") as image_file:
-            content = image_file.read()
-        
-        media_type = db_image.mime_type
-        headers = {
-            "X-Image-Name": db_image.file_name,
-            "X-Image-ID": str(db_image.id)
-        }
-        return Response(content=content, media_type=media_type, headers=headers)
+    if db_image.file_path and await aiofiles.os.path.exists(db_image.file_path):
+        return await local_file_response(
+            request, db_image.file_path, db_image.mime_type, db_image.file_hash, headers
+        )
     
+    # 图床取图失败且没有本地副本时返回503（熔断中）或502
+    _raise_if_image_bed_failed(db_image)
     # 如果既没有图床URL也没有本地文件，返回404
     raise HTTPException(status_code=404, detail="图片文件不可用")
 
 
-@router.post("/image/{image_id}/like")
-async def like_image(image_id: int, db: Session = Depends(get_db)):
-    """为指定ID的图片增加点赞数"""
-    db_image = update_image_likes(db, image_id, increment=True)
+@router.get("/image/{image_id}/thumb")
+async def fetch_image_thumbnail(
+    image_id: int,
+    request: Request,
+    size: str = THUMBNAIL_DEFAULT_SIZE,
+    db: AsyncSession = Depends(get_db)
+):
+    """获取图片缩略图（WebP），不区分审核状态；缩略图缺失时按需生成"""
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail=f"size 只支持: {', '.join(THUMBNAIL_SIZES)}")
+
+    db_image = await get_image_by_id(db, image_id)
     if not db_image:
         raise HTTPException(status_code=404, detail="图片未找到")
-    
-    return {
-        "id": db_image.id,
-        "likes": db_image.likes,
-        "dislikes": db_image.dislikes
+
+    headers = {
+        "X-Image-ID": str(db_image.id),
+        "Cache-Control": "public, max-age=86400"
     }
+    # 缩略图由原图哈希和规格唯一确定
+    thumb_tag = f"{db_image.file_hash}-{size}"
+    if etag_matches(request, file_etag(thumb_tag)):
+        return not_modified_response(file_etag(thumb_tag), headers)
 
+    path = await thumbnail_service.ensure(db_image, size)
+    if path:
+        return await local_file_response(request, path, "image/webp", thumb_tag, headers)
 
-@router.post("/image/{image_id}/dislike")
-async def dislike_image(image_id: int, db: Session = Depends(get_db)):
-    """为指定ID的图片增加点踩数"""
-    db_image = update_image_dislikes(db, image_id, increment=True)
+    _raise_if_image_bed_failed(db_image, upstream_only=False)
+    raise HTTPException(status_code=404, detail="图片文件不可用")
+
+
+async def _ensure_vote_counts(db: AsyncSession, image_id: int):
+    """投票前确认图片存在；缓冲中已有计数的图片不再查询数据库"""
+    if vote_buffer.view(image_id) is not None:
+        return
+    db_image = await get_image_by_id(db, image_id)
     if not db_image:
         raise HTTPException(status_code=404, detail="图片未找到")
-    
+    vote_buffer.observe(db_image.id, db_image.likes, db_image.dislikes)
+
+
+@router.post("/image/{image_id}/like")
+async def like_image(image_id: int, db: AsyncSession = Depends(get_db)):
+    """为指定ID的图片增加点赞数（内存中合并，定期批量写回数据库）"""
+    await _ensure_vote_counts(db, image_id)
+    likes, dislikes = vote_buffer.record(image_id, likes=1)
+
     return {
-        "id": db_image.id,
-        "likes": db_image.likes,
-        "dislikes": db_image.dislikes
+        "id": image_id,
+        "likes": likes,
+        "dislikes": dislikes
+    }
+
+
+@router.post("/image/{image_id}/dislike")
+async def dislike_image(image_id: int, db: AsyncSession = Depends(get_db)):
+    """为指定ID的图片增加点踩数（内存中合并，定期批量写回数据库）"""
+    await _ensure_vote_counts(db, image_id)
+    likes, dislikes = vote_buffer.record(image_id, dislikes=1)
+
+    return {
+        "id": image_id,
+        "likes": likes,
+        "dislikes": dislikes
     }
 
 
 @router.get("/images/list")
 async def list_images(
     checked: bool = None,
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    after_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
 ):
-    """获取图片列表，可以按照审核状态过滤"""
+    """获取图片列表，可以按照审核状态过滤
+
+    结果按ID升序；翻页时把上一页最后一张图片的ID作为 after_id 传入（游标分页，
+    深页与首页代价相同），传入 after_id 时忽略 skip。
+    """
     if checked is not None:
         if checked:
-            images = get_all_checked_images(db, skip, limit)
+            images = await get_all_checked_images(db, skip, limit, after_id=after_id)
         else:
-            images = get_all_unchecked_images(db, skip, limit)
+            images = await get_all_unchecked_images(db, skip, limit, after_id=after_id)
     else:
         # 不过滤，获取所有图片
-        images = db.query(Image).offset(skip).limit(limit).all()
+        images = await get_all_images(db, skip, limit, after_id=after_id)
     
-    return [
-        {
+    results = []
+    for img in images:
+        # 与单张图片接口一致，计数叠加尚未写回的投票
+        likes, dislikes = vote_buffer.observe(img.id, img.likes, img.dislikes)
+        results.append({
             "id": img.id,
             "file_name": img.file_name,
             "is_checked": img.is_checked,
-            "likes": img.likes,
-            "dislikes": img.dislikes,
+            "likes": likes,
+            "dislikes": dislikes,
             "image_bed_url": img.image_bed_url or "",
             "file_size": img.file_size
-        } for img in images
-    ]
+        })
+    return results
 
 
 @router.post("/image/{image_id}/check")
 async def check_image(
     image_id: int,
     is_checked: bool = True,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """更新图片的审核状态"""
     # 先获取图片信息
-    db_image = db.query(Image).filter(Image.id == image_id).first()
+    db_image = await get_image_by_id(db, image_id)
     if not db_image:
         raise HTTPException(status_code=404, detail="图片未找到")
     
-    # 如果是通过审核且有本地文件，移动文件到checked目录
-    if is_checked and db_image.file_path and os.path.exists(db_image.file_path):
-        try:
-            # 从unchecked路径获取文件名
-            filename = os.path.basename(db_image.file_path)
-            # 构建checked目录的新路径
-            new_file_path = os.path.join(CHECKED_DIR, filename)
-            
-            # 如果文件已存在，添加数字后缀
-            counter = 1
-            base_path = new_file_path
-            while os.path.exists(new_file_path):
-                name, ext = os.path.splitext(base_path)
-                new_file_path = f"{name}_{counter}{ext}"
-                counter += 1
-            
-            # 移动文件
-            shutil.move(db_image.file_path, new_file_path)
-            print(f"图片文件已移动: {db_image.file_path} -> {new_file_path}")
-            
-            # 更新数据库中的文件路径
-            db_image.file_path = new_file_path
-            
-        except Exception as e:
-            print(f"移动文件失败: {e}")
-            # 继续执行，不中断审核流程
-    
+    # 本地文件按内容寻址存放，审核状态只需更新数据库，不移动文件
     # 更新审核状态
+    was_checked = db_image.is_checked
     db_image.is_checked = is_checked
-    db.commit()
-    db.refresh(db_image)
+    await db.commit()
+    await db.refresh(db_image)
+    sync_checked_status(db_image, was_checked)
+    if is_checked:
+        thumbnail_service.schedule_ensure(db_image)
     
     return {
         "id": db_image.id,
@@ -1,19 +1,25 @@
 # 上传相关路由
+import asyncio
+import json
 import os
 from fastapi import APIRouter, File, UploadFile, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
 # 导入日志
 from logger_config import get_logger
 
-from database import get_db, add_image, get_image_by_hash
+from database import get_db, add_image, get_image_by_hash, find_similar_images, set_upload_status, SessionLocal
 from services.picgo_service import picgo_service
-from utils.image_utils import (
-    validate_image_type, calculate_file_hash, create_safe_filename, 
-    get_unique_filepath, get_image_dimensions
+from services.upload_jobs import UploadJob, upload_job_queue
+from services.storage import content_store
+from services.thumbnails import thumbnail_service
+from utils.image_utils import validate_image_type
+from utils.upload_utils import IngestedFile, ingest_upload
+from config import (
+    MAX_BATCH_UPLOAD_FILES, BATCH_UPLOAD_CONCURRENCY, PHASH_DUP_MODE, PHASH_DUP_DISTANCE
 )
-from config import UNCHECKED_DIR
 from models import PicGoUploadResponse
 
 router = APIRouter()
@@ -21,8 +27,16 @@ logger = get_logger(__name__)
 
 
 @router.post("/upload/")
-async def upload_image(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    """上传图片到PicGo图床并将信息存入数据库"""
+async def upload_image(
+    file: UploadFile = File(...),
+    background: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """上传图片到PicGo图床并将信息存入数据库
+
+    background=true 时图片先保存到本地并入库，立即返回202和任务ID，
+    由后台任务推送到图床，进度通过 /upload/jobs/{job_id} 查询。
+    """
     # 检查文件类型
     if not validate_image_type(file.content_type):
         raise HTTPException(
@@ -30,13 +44,12 @@ async def upload_image(file: UploadFile = File(...), db: Session = Depends(get_d
             detail="只允许上传图片文件（JPEG, PNG, GIF, WEBP）"
         )
     
-    # 读取文件内容并计算哈希值用于查重
-    contents = await file.read()
-    file_hash = calculate_file_hash(contents)
-    await file.seek(0)  # 重置文件指针
+    # 分块读取文件，计算哈希值用于查重（超过大小限制时提前返回413）
+    ingested = await ingest_upload(file)
+    file_hash = ingested.file_hash
     
     # 检查数据库中是否已存在相同哈希值的图片
-    existing_image = get_image_by_hash(db, file_hash)
+    existing_image = await get_image_by_hash(db, file_hash)
     
     if existing_image:
         return {
@@ -47,6 +60,12 @@ async def upload_image(file: UploadFile = File(...), db: Session = Depends(get_d
             "image_bed_url": existing_image.image_bed_url
         }
     
+    # 按感知哈希查找近似重复（重新编码、缩放、截图后的同一张图）
+    similar_images = await _check_near_duplicates(ingested, db)
+    
+    if background:
+        return await _enqueue_background_upload(ingested, db, similar_images)
+    
     # 使用PicGo服务上传
     try:
         result = await picgo_service.upload_file(
@@ -54,7 +73,8 @@ async def upload_image(file: UploadFile = File(...), db: Session = Depends(get_d
             db=db,
             title=f"Meme_{file_hash[:8]}",
             description="从Meme系统上传的图片",
-            auto_check=False  # 默认未审核
+            auto_check=False,  # 默认未审核
+            ingested=ingested
         )
         
         return {
@@ -68,9 +88,12 @@ async def upload_image(file: UploadFile = File(...), db: Session = Depends(get_d
             "dislikes": 0,
             "file_size": result.get("image", {}).get("size", 0),
             "width": result.get("image", {}).get("width", 0),
-            "height": result.get("image", {}).get("height", 0)
+            "height": result.get("image", {}).get("height", 0),
+            "similar_images": similar_images
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -78,6 +101,82 @@ async def upload_image(file: UploadFile = File(...), db: Session = Depends(get_d
         )
 
 
+async def _check_near_duplicates(ingested: IngestedFile, db: AsyncSession) -> list:
+    """计算感知哈希并查找近似重复；PHASH_DUP_MODE=reject 时发现近似重复直接返回409"""
+    phash = await ingested.compute_phash()
+    if not phash or PHASH_DUP_MODE == "off":
+        return []
+    
+    similar_images = await find_similar_images(db, phash, PHASH_DUP_DISTANCE)
+    if similar_images and PHASH_DUP_MODE == "reject":
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "已存在相似的图片", "similar_images": similar_images}
+        )
+    return similar_images
+
+
+async def _enqueue_background_upload(ingested: IngestedFile, db: AsyncSession, similar_images: list) -> JSONResponse:
+    """保存到本地存储并入库，提交后台推送任务，返回202"""
+    if upload_job_queue.is_full():
+        raise HTTPException(status_code=503, detail="上传任务繁忙，请稍后重试")
+    
+    file_hash = ingested.file_hash
+    # 按内容寻址保存，审核通过时不需要移动文件
+    file_path = await content_store.save(ingested)
+    width, height = await ingested.dimensions()
+    placeholder = await ingested.compute_placeholder()
+    
+    # 推送到图床前图片由本地文件提供
+    db_image = await add_image(
+        db=db,
+        file_name=os.path.basename(file_path),
+        file_hash=file_hash,
+        file_path=file_path,
+        image_bed_url="",
+        is_checked=False,
+        file_size=ingested.size,
+        mime_type=ingested.content_type,
+        width=width,
+        height=height,
+        phash=ingested.phash,
+        # 由当前进程立即提交推送任务
+        upload_status="uploading",
+        **placeholder
+    )
+    # 缩略图从刚写入的本地文件生成
+    thumbnail_service.schedule_ensure(db_image)
+    
+    job = UploadJob.for_image(db_image)
+    if not upload_job_queue.submit(job):
+        # 未能提交时留给下次启动时的认领
+        await set_upload_status(db, db_image.id, "pending")
+    
+    return JSONResponse(status_code=202, content={
+        "status": "accepted",
+        "message": "图片已接收，正在后台上传到图床",
+        "job_id": job.id,
+        "job_status": job.status,
+        "status_url": f"/upload/jobs/{job.id}",
+        "filename": db_image.file_name,
+        "id": db_image.id,
+        "is_checked": False,
+        "file_size": ingested.size,
+        "width": width,
+        "height": height,
+        "similar_images": similar_images
+    })
+
+
+@router.get("/upload/jobs/{job_id}")
+async def get_upload_job(job_id: str):
+    """查询后台上传任务的状态"""
+    job = upload_job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="上传任务不存在或已过期")
+    return job.to_dict()
+
+
 @router.post("/upload/picgo", response_model=PicGoUploadResponse)
 async def upload_to_picgo(
     file: UploadFile = File(...),
@@ -92,7 +191,7 @@ async def upload_to_picgo(
     nsfw: Optional[int] = 0,
     format: Optional[str] = "json",
     use_file_date: Optional[int] = 0,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """上传图片到 PicGo 图床，支持指定相册"""
     
@@ -107,26 +206,41 @@ async def upload_to_picgo(
     if not album_id:
         album_id = "Spkw6"
     
+    # 分块读取文件，计算哈希值（超过大小限制时提前返回413）
+    ingested = await ingest_upload(file)
+    
+    return await _upload_ingested_to_picgo(
+        ingested,
+        db,
+        api_key=api_key,
+        title=title,
+        description=description,
+        tags=tags,
+        album_id=album_id,
+        category_id=category_id,
+        width=width,
+        expiration=expiration,
+        nsfw=nsfw,
+        format=format,
+        use_file_date=use_file_date
+    )
+
+
+async def _upload_ingested_to_picgo(ingested: IngestedFile, db: AsyncSession, **options) -> PicGoUploadResponse:
+    """把已接收的文件上传到 PicGo 图床，PicGo直接上传默认自动审核通过"""
     try:
         result = await picgo_service.upload_file(
-            file=file,
+            file=ingested.upload,
             db=db,
-            api_key=api_key,
-            title=title,
-            description=description,
-            tags=tags,
-            album_id=album_id,
-            category_id=category_id,
-            width=width,
-            expiration=expiration,
-            nsfw=nsfw,
-            format=format,
-            use_file_date=use_file_date,
-            auto_check=True  # PicGo直接上传默认自动审核通过
+            auto_check=True,
+            ingested=ingested,
+            **options
         )
         
         return PicGoUploadResponse(**result)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -184,7 +298,7 @@ async def upload_to_picgo_album(
     title: Optional[str] = None,
     description: Optional[str] = None,
     tags: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """直接上传图片到指定相册"""
     
@@ -208,57 +322,96 @@ async def batch_upload_to_album(
     titles: Optional[str] = None,  # 逗号分隔的标题列表
     description: Optional[str] = None,
     tags: Optional[str] = None,
-    db: Session = Depends(get_db)
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db)
 ):
-    """批量上传图片到指定相册"""
+    """批量上传图片到指定相册
+
+    最多 BATCH_UPLOAD_CONCURRENCY 个文件同时上传，整批耗时接近单张上传的耗时。
+    stream=true 时以 NDJSON 逐行返回：每个文件完成即输出一行结果（含 index），最后一行为汇总。
+    """
     
-    if len(files) > 10:
-        raise HTTPException(status_code=400, detail="一次最多上传10张图片")
+    if len(files) > MAX_BATCH_UPLOAD_FILES:
+        raise HTTPException(status_code=400, detail=f"一次最多上传{MAX_BATCH_UPLOAD_FILES}张图片")
     
     # 解析标题列表
     title_list = []
     if titles:
         title_list = [title.strip() for title in titles.split(',')]
     
-    results = []
-    success_count = 0
-    
+    # 先在本地校验并接收全部文件，失败的文件直接记为错误
+    failed = []
+    ingested_files = []
     for i, file in enumerate(files):
         try:
-            # 为每个文件分配标题
-            file_title = title_list[i] if i < len(title_list) else None
-            
-            result = await upload_to_picgo(
-                file=file,
-                api_key=api_key,
-                title=file_title,
-                description=description,
-                tags=tags,
-                album_id=album_id,
-                db=db
-            )
-            
-            results.append({
-                "filename": file.filename,
-                "success": True,
-                "result": result.dict() if hasattr(result, 'dict') else result
-            })
-            success_count += 1
-            
+            if not validate_image_type(file.content_type):
+                raise HTTPException(
+                    status_code=400,
+                    detail="只允许上传图片文件（JPEG, PNG, GIF, WEBP）"
+                )
+            ingested_files.append((i, await ingest_upload(file)))
         except Exception as e:
-            results.append({
-                "filename": file.filename,
-                "success": False,
-                "error": str(e)
-            })
+            failed.append({"index": i, "filename": file.filename, "success": False, "error": str(e)})
     
-    return {
-        "album_id": album_id,
-        "total_files": len(files),
-        "results": results,
-        "success_count": success_count,
-        "error_count": len(files) - success_count
-    }
+    semaphore = asyncio.Semaphore(BATCH_UPLOAD_CONCURRENCY)
+    
+    async def upload_one(index: int, ingested: IngestedFile):
+        item = {"index": index, "filename": ingested.filename}
+        try:
+            async with semaphore:
+                # 并发上传的文件不能共用一个会话，每个文件使用独立的数据库会话
+                async with SessionLocal() as task_db:
+                    result = await _upload_ingested_to_picgo(
+                        ingested,
+                        task_db,
+                        api_key=api_key,
+                        title=title_list[index] if index < len(title_list) else None,  # 为每个文件分配标题
+                        description=description,
+                        tags=tags,
+                        album_id=album_id
+                    )
+            item.update(success=True, result=result.dict())
+        except Exception as e:
+            item.update(success=False, error=str(e))
+        return item
+    
+    def summary(results):
+        success_count = sum(1 for item in results if item["success"])
+        return {
+            "album_id": album_id,
+            "total_files": len(files),
+            "success_count": success_count,
+            "error_count": len(files) - success_count
+        }
+    
+    if not stream:
+        uploaded = await asyncio.gather(*(upload_one(i, ingested) for i, ingested in ingested_files))
+        results = sorted(failed + list(uploaded), key=lambda item: item["index"])
+        return {**summary(results), "results": results}
+    
+    # 流式返回时请求处理函数会先于上传结束返回，接管临时文件以免被提前关闭
+    for _, ingested in ingested_files:
+        ingested.detach()
+    
+    async def generate():
+        tasks = [asyncio.create_task(upload_one(i, ingested)) for i, ingested in ingested_files]
+        results = list(failed)
+        try:
+            for item in failed:
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                results.append(item)
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+            yield json.dumps({**summary(results), "done": True}, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时取消未完成的上传
+            for task in tasks:
+                task.cancel()
+            for _, ingested in ingested_files:
+                await ingested.close()
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
 
 @router.get("/picgo/status")
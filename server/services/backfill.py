@@ -0,0 +1,164 @@
+# 后台补算任务 - 为已有图片补算上传时才开始计算的字段
+import asyncio
+import time
+from typing import Any, Callable, Dict, Optional
+
+import aiofiles
+import aiofiles.os
+from starlette.concurrency import run_in_threadpool
+
+# 导入日志
+from logger_config import get_logger
+
+from config import BACKFILL_BATCH_SIZE
+from database import SessionLocal, Image, get_images_missing, update_image_fields
+from services.http_client import get_http_client
+from services.image_cache import image_cache
+from services.phash_index import phash_index
+from services.resilience import image_bed_breaker, resilient_request
+from utils.image_utils import compute_dhash, compute_placeholder
+
+logger = get_logger(__name__)
+
+
+async def read_image_content(db_image: Image) -> Optional[bytes]:
+    """读取图片内容：依次尝试本地文件、磁盘缓存和图床"""
+    candidates = [db_image.file_path]
+    if db_image.file_hash and image_cache.enabled:
+        candidates.append(image_cache.path_for(db_image.file_hash))
+    for path in candidates:
+        if path and await aiofiles.os.path.exists(path):
+            async with aiofiles.open(path, "rb") as f:
+                return await f.read()
+
+    image_url = (db_image.image_bed_url or "").strip()
+    if image_url.startswith(("http://", "https://")):
+        client = get_http_client()
+        try:
+            response = await resilient_request(image_bed_breaker, lambda: client.get(image_url), idempotent=True)
+        except Exception as e:
+            logger.warning(f"读取图床图片失败 - ID: {db_image.id}, 错误: {e}")
+            return None
+        if response.status_code == 200:
+            return response.content
+    return None
+
+
+class BackfillJob:
+    """补算任务
+
+    按ID升序分批取出 column_name 为空的图片，读取内容后在线程池中调用 compute 计算
+    要写回的列，逐张写回。读不到内容或计算失败的图片跳过，不会阻塞后续批次。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        column_name: str,
+        compute: Callable[[bytes], Optional[Dict[str, Any]]],
+        on_updated: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+        batch_size: int = BACKFILL_BATCH_SIZE
+    ):
+        self.name = name
+        self.column_name = column_name
+        self.compute = compute
+        self.on_updated = on_updated
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self._reset("idle")
+
+    def _reset(self, state: str):
+        self.state = state  # idle / running / done / failed / cancelled
+        self.processed = 0
+        self.updated = 0
+        self.skipped = 0
+        self.last_id = 0
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> bool:
+        """启动任务；已在运行时返回False"""
+        if self.running:
+            return False
+        self._reset("running")
+        self.started_at = time.time()
+        self._task = asyncio.create_task(self._run())
+        return True
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "processed": self.processed,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "last_id": self.last_id,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    async def _run(self):
+        logger.info(f"[{self.name}] 补算任务开始")
+        try:
+            while True:
+                async with SessionLocal() as db:
+                    images = await get_images_missing(db, self.column_name, self.last_id, self.batch_size)
+                    if not images:
+                        break
+                    for db_image in images:
+                        self.last_id = db_image.id
+                        self.processed += 1
+                        content = await read_image_content(db_image)
+                        values = await run_in_threadpool(self.compute, content) if content else None
+                        if not values:
+                            self.skipped += 1
+                            continue
+                        await update_image_fields(db, db_image.id, **values)
+                        if self.on_updated:
+                            self.on_updated(db_image.id, values)
+                        self.updated += 1
+            self.state = "done"
+        except asyncio.CancelledError:
+            self.state = "cancelled"
+            raise
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.error(f"[{self.name}] 补算任务失败: {e}")
+        finally:
+            self.finished_at = time.time()
+            logger.info(f"[{self.name}] 补算任务结束 - 处理: {self.processed}, 更新: {self.updated}, 跳过: {self.skipped}")
+
+
+def _compute_phash(content: bytes) -> Optional[Dict[str, Any]]:
+    phash = compute_dhash(content)
+    return {"phash": phash} if phash else None
+
+
+# 创建全局补算任务，按名称在管理接口中启动和查询
+backfill_jobs: Dict[str, BackfillJob] = {
+    "phash": BackfillJob(
+        "phash", "phash", _compute_phash,
+        on_updated=lambda image_id, values: phash_index.add(image_id, values["phash"])
+    ),
+    "placeholder": BackfillJob("placeholder", "placeholder", compute_placeholder),
+}
+
+
+async def stop_backfill_jobs():
+    for job in backfill_jobs.values():
+        await job.stop()
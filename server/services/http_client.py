@@ -0,0 +1,56 @@
+# 共享HTTP客户端 - 所有访问图床的请求复用同一个连接池
+import importlib.util
+from typing import Optional
+
+import httpx
+
+# 导入日志
+from logger_config import get_logger
+
+from config import (
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_WRITE_TIMEOUT, HTTP_POOL_TIMEOUT,
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY, HTTP2_ENABLED
+)
+
+logger = get_logger(__name__)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    """HTTP/2 需要安装 h2（httpx[http2]）"""
+    return HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+
+
+def _create_client() -> httpx.AsyncClient:
+    timeout = httpx.Timeout(
+        connect=HTTP_CONNECT_TIMEOUT,
+        read=HTTP_READ_TIMEOUT,
+        write=HTTP_WRITE_TIMEOUT,
+        pool=HTTP_POOL_TIMEOUT
+    )
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    )
+    http2 = _http2_available()
+    logger.info(f"创建共享HTTP客户端 - HTTP/2: {http2}, 最大连接数: {HTTP_MAX_CONNECTIONS}")
+    return httpx.AsyncClient(timeout=timeout, limits=limits, http2=http2)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取应用级共享客户端（首次调用时创建）"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+    return _client
+
+
+async def close_http_client():
+    """关闭共享客户端，释放保持的连接"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("共享HTTP客户端已关闭")
+    _client = None
@@ -0,0 +1,199 @@
+# 图片磁盘缓存 - 按文件哈希缓存图床内容，超出字节预算时按LRU淘汰
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import aiofiles
+import aiofiles.os
+from starlette.concurrency import run_in_threadpool
+
+# 导入日志
+from logger_config import get_logger
+
+from config import IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES
+
+logger = get_logger(__name__)
+
+TEMP_SUFFIX = ".tmp"
+
+
+class CacheWriter:
+    """写入一个缓存条目：先写同目录下的临时文件，完成后原子重命名
+
+    进程崩溃时只会留下临时文件（下次加载时清理），不会出现写了一半的缓存条目。
+    """
+
+    def __init__(self, cache: "DiskImageCache", key: str, temp_path: str, file):
+        self._cache = cache
+        self._key = key
+        self._temp_path = temp_path
+        self._file = file
+        self.size = 0
+
+    async def write(self, chunk: bytes):
+        await self._file.write(chunk)
+        self.size += len(chunk)
+
+    async def commit(self):
+        """落盘并原子替换到最终路径"""
+        await self._file.flush()
+        await run_in_threadpool(os.fsync, self._file.fileno())
+        await self._file.close()
+        await aiofiles.os.replace(self._temp_path, self._cache.path_for(self._key))
+        # 登记条目并按需淘汰（会删除文件，放到线程中执行）
+        await run_in_threadpool(self._cache._register, self._key, self.size)
+
+    async def abort(self):
+        """放弃写入并删除临时文件"""
+        await self._file.close()
+        try:
+            await aiofiles.os.remove(self._temp_path)
+        except FileNotFoundError:
+            pass
+
+
+class DiskImageCache:
+    """以字节预算为上限的磁盘LRU缓存
+
+    条目文件布局为 <目录>/<键前两位>/<键>。最近使用顺序只保存在内存中，
+    重启后按文件修改时间恢复，因此跨重启的顺序是近似的。
+    """
+
+    def __init__(self, directory: str, max_bytes: int, name: str = "image-cache"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.name = name
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def load(self):
+        """扫描缓存目录重建索引，清理残留的临时文件（阻塞，启动时在线程中调用）"""
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                if filename.endswith(TEMP_SUFFIX):
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_mtime, filename, stat.st_size))
+
+        found.sort()
+        with self._lock:
+            self._entries = OrderedDict((key, size) for _, key, size in found)
+            self._total_bytes = sum(self._entries.values())
+            evicted = self._evict_locked()
+        self._remove_files(evicted)
+        logger.info(f"[{self.name}] 已加载 {len(self._entries)} 个缓存条目, 共 {self._total_bytes} 字节")
+
+    def get(self, key: str) -> Optional[str]:
+        """命中时返回缓存文件路径并标记为最近使用"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self.path_for(key)
+            self.misses += 1
+            return None
+
+    async def open_writer(self, key: str) -> Optional[CacheWriter]:
+        """开始写入一个条目；缓存未启用时返回None"""
+        if not self.enabled:
+            return None
+        shard_dir = os.path.dirname(self.path_for(key))
+        await aiofiles.os.makedirs(shard_dir, exist_ok=True)
+        fd, temp_path = await run_in_threadpool(
+            tempfile.mkstemp, dir=shard_dir, prefix=f".{key}.", suffix=TEMP_SUFFIX
+        )
+        os.close(fd)
+        file = await aiofiles.open(temp_path, "wb")
+        return CacheWriter(self, key, temp_path, file)
+
+    async def put(self, key: str, content: bytes):
+        """写入完整内容"""
+        writer = await self.open_writer(key)
+        if writer is None:
+            return
+        try:
+            await writer.write(content)
+            await writer.commit()
+        except Exception:
+            await writer.abort()
+            raise
+
+    def discard(self, key: str):
+        """缓存文件已丢失时移出索引"""
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is not None:
+                self._total_bytes -= size
+
+    async def remove(self, keys):
+        """删除一组条目及其文件（图片被删除时调用），不存在的键忽略"""
+        keys = list(keys)
+        with self._lock:
+            for key in keys:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+        await run_in_threadpool(self._remove_files, keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def _register(self, key: str, size: int):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous
+            self._entries[key] = size
+            self._total_bytes += size
+            evicted = self._evict_locked()
+        self._remove_files(evicted)
+
+    def _evict_locked(self):
+        evicted = []
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            evicted.append(key)
+        return evicted
+
+    def _remove_files(self, keys):
+        for key in keys:
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+
+
+# 创建全局缓存实例（图床原图）
+image_cache = DiskImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
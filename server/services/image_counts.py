@@ -0,0 +1,57 @@
+# 待审核图片计数 - 进程内维护，管理页分页不再每次对全表 COUNT(*)
+import threading
+import time
+from typing import Optional
+
+# 导入日志
+from logger_config import get_logger
+
+from config import IMAGE_COUNT_RECONCILE_SECONDS
+
+logger = get_logger(__name__)
+
+
+class UncheckedImageCounter:
+    """待审核图片数量
+
+    已审核数量直接取已审核图片ID池的大小，这里只维护待审核数量。
+    上传、审核、拒绝、删除路径负责增量加减，另按固定周期与数据库对账，
+    以修正其它进程（多worker部署）造成的偏差。
+    """
+
+    def __init__(self, reconcile_interval: int = IMAGE_COUNT_RECONCILE_SECONDS):
+        self.reconcile_interval = reconcile_interval
+        self._count = 0
+        self._lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+
+    @property
+    def value(self) -> int:
+        return self._count
+
+    def needs_reload(self) -> bool:
+        """是否需要与数据库对账"""
+        if self._loaded_at is None:
+            return True
+        return time.monotonic() - self._loaded_at >= self.reconcile_interval
+
+    def invalidate(self):
+        """标记计数失效，下次访问时强制对账"""
+        self._loaded_at = None
+
+    def reload(self, count: int):
+        """用数据库中的实际数量覆盖计数"""
+        with self._lock:
+            drift = count - self._count
+            self._count = count
+            self._loaded_at = time.monotonic()
+        logger.debug(f"待审核图片计数已对账 - 数量: {count}, 变化: {drift:+d}")
+
+    def adjust(self, delta: int):
+        """增量加减"""
+        with self._lock:
+            self._count = max(self._count + delta, 0)
+
+
+# 创建全局计数实例
+unchecked_image_counter = UncheckedImageCounter()
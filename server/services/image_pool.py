@@ -0,0 +1,223 @@
+# 已审核图片ID池 - 进程内维护，随机选图只需一次数组下标访问
+import math
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 导入日志
+from logger_config import get_logger
+
+from config import CHECKED_POOL_RECONCILE_SECONDS
+
+logger = get_logger(__name__)
+
+
+def score_weight(likes: int, dislikes: int) -> float:
+    """按点赞/点踩计算抽样权重
+
+    拉普拉斯平滑后的好评率，再按点赞数取对数加成；
+    新图片（0赞0踩）权重为0.5，不会被完全冷落。
+    """
+    likes = max(likes or 0, 0)
+    dislikes = max(dislikes or 0, 0)
+    return (likes + 1) / (likes + dislikes + 2) * (1 + math.log1p(likes))
+
+
+class FenwickTree:
+    """浮点权重的树状数组，支持O(log N)单点更新和按前缀和查找"""
+
+    def __init__(self, weights: Iterable[float] = ()):
+        self._tree: List[float] = [0.0]
+        self.build(list(weights))
+
+    def __len__(self) -> int:
+        return len(self._tree) - 1
+
+    def build(self, weights: List[float], capacity: int = 0):
+        """O(N) 线性建树，capacity 为预留容量"""
+        size = max(len(weights), capacity, 1)
+        tree = [0.0] * (size + 1)
+        tree[1:len(weights) + 1] = weights
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def add(self, index: int, delta: float):
+        """第 index 个位置（从0开始）的权重加上 delta"""
+        i = index + 1
+        size = len(self._tree) - 1
+        while i <= size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def total(self) -> float:
+        """全部权重之和"""
+        result = 0.0
+        i = len(self._tree) - 1
+        while i > 0:
+            result += self._tree[i]
+            i -= i & -i
+        return result
+
+    def find(self, target: float) -> int:
+        """返回前缀和首次超过 target 的位置（从0开始）"""
+        position = 0
+        size = len(self._tree) - 1
+        step = 1 << size.bit_length()
+        while step:
+            next_position = position + step
+            if next_position <= size and self._tree[next_position] <= target:
+                position = next_position
+                target -= self._tree[next_position]
+            step >>= 1
+        return position
+
+
+class CheckedImagePool:
+    """已审核图片ID池
+
+    使用数组 + 下标字典保存ID，增删和随机选取均为O(1)。
+    与数组位置对齐维护一棵按得分加权的树状数组，加权抽样为O(log N)，
+    点赞/点踩只需增量更新对应位置的权重。
+    审核、拒绝、删除路径负责增量维护，另按固定周期与数据库全量对账，
+    以修正其它进程（多worker部署）造成的偏差和浮点累计误差。
+    """
+
+    def __init__(self, reconcile_interval: int = CHECKED_POOL_RECONCILE_SECONDS):
+        self.reconcile_interval = reconcile_interval
+        self._ids: List[int] = []
+        self._weights: List[float] = []
+        self._positions: Dict[int, int] = {}
+        self._tree = FenwickTree()
+        self._lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+        # 见过的最大ID，作为洗牌牌组的ID值域上界
+        self.max_id = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, image_id: int) -> bool:
+        return image_id in self._positions
+
+    def needs_reload(self) -> bool:
+        """是否需要与数据库对账"""
+        if self._loaded_at is None:
+            return True
+        return time.monotonic() - self._loaded_at >= self.reconcile_interval
+
+    def invalidate(self):
+        """标记ID池失效，下次访问时强制对账"""
+        self._loaded_at = None
+
+    def reload(self, rows: Iterable[Tuple[int, int, int]]):
+        """用数据库中的全量已审核图片 (id, likes, dislikes) 重建ID池"""
+        scores = {image_id: score_weight(likes, dislikes) for image_id, likes, dislikes in rows}
+        ids = list(scores)
+        weights = list(scores.values())
+        with self._lock:
+            drift = len(ids) - len(self._ids)
+            self._ids = ids
+            self._weights = weights
+            self._positions = {image_id: i for i, image_id in enumerate(ids)}
+            self._tree.build(weights, capacity=len(ids) * 2)
+            self.max_id = max(ids, default=0)
+            self._loaded_at = time.monotonic()
+        logger.debug(f"已审核图片ID池已对账 - 数量: {len(ids)}, 变化: {drift:+d}")
+
+    def add(self, image_id: int, likes: int = 0, dislikes: int = 0):
+        """加入一张已审核图片"""
+        weight = score_weight(likes, dislikes)
+        with self._lock:
+            if image_id in self._positions:
+                return
+            position = len(self._ids)
+            if position >= len(self._tree):
+                # 容量不足时翻倍重建，均摊O(1)
+                self._tree.build(self._weights, capacity=(position + 1) * 2)
+            self._positions[image_id] = position
+            self._ids.append(image_id)
+            self._weights.append(weight)
+            self._tree.add(position, weight)
+            self.max_id = max(self.max_id, image_id)
+
+    def remove(self, image_id: int):
+        """移除一张图片（交换到末尾后弹出）"""
+        with self._lock:
+            position = self._positions.pop(image_id, None)
+            if position is None:
+                return
+            last_id = self._ids.pop()
+            last_weight = self._weights.pop()
+            last_position = len(self._ids)
+            self._tree.add(last_position, -last_weight)
+            if position < last_position:
+                self._tree.add(position, last_weight - self._weights[position])
+                self._ids[position] = last_id
+                self._weights[position] = last_weight
+                self._positions[last_id] = position
+
+    def update_score(self, image_id: int, likes: int, dislikes: int):
+        """点赞/点踩变化后增量更新权重"""
+        weight = score_weight(likes, dislikes)
+        with self._lock:
+            position = self._positions.get(image_id)
+            if position is None:
+                return
+            self._tree.add(position, weight - self._weights[position])
+            self._weights[position] = weight
+
+    def random_id(self, exclude: Optional[int] = None) -> Optional[int]:
+        """随机返回一个ID，可排除指定ID"""
+        with self._lock:
+            count = len(self._ids)
+            excluded_position = self._positions.get(exclude) if exclude is not None else None
+            if excluded_position is None:
+                return self._ids[random.randrange(count)] if count else None
+
+            if count <= 1:
+                return None
+            # 在除被排除项外的 count-1 个位置中均匀选取
+            position = random.randrange(count - 1)
+            if position == excluded_position:
+                position = count - 1
+            return self._ids[position]
+
+    def weighted_random_id(self, exclude: Optional[int] = None) -> Optional[int]:
+        """按得分权重随机返回一个ID，可排除指定ID"""
+        with self._lock:
+            count = len(self._ids)
+            excluded_position = self._positions.get(exclude) if exclude is not None else None
+            if count == 0 or (excluded_position is not None and count == 1):
+                return None
+
+            # 暂时把被排除项的权重置零，抽样后恢复
+            if excluded_position is not None:
+                self._tree.add(excluded_position, -self._weights[excluded_position])
+            try:
+                position = self._tree.find(random.random() * self._tree.total())
+            finally:
+                if excluded_position is not None:
+                    self._tree.add(excluded_position, self._weights[excluded_position])
+
+            # 浮点误差可能让位置落在末尾之外或落到被排除项上
+            position = min(position, count - 1)
+            if position == excluded_position:
+                position = count - 1 if position != count - 1 else count - 2
+            return self._ids[position]
+
+    def sample(self, count: int, exclude: Iterable[int] = ()) -> List[int]:
+        """无放回地随机选取最多 count 个不同ID，可排除一组ID"""
+        excluded = set(exclude)
+        with self._lock:
+            # 多取被排除的数量，过滤后仍能凑够 count 个
+            sample_size = min(len(self._ids), count + len(excluded & self._positions.keys()))
+            picked = random.sample(self._ids, sample_size)
+        return [image_id for image_id in picked if image_id not in excluded][:count]
+
+
+# 创建全局ID池实例
+checked_image_pool = CheckedImagePool()
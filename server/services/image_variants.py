@@ -0,0 +1,239 @@
+# 派生图片服务 - 按 Accept 协商的 AVIF/WebP 转码结果与按宽度档位缩小的版本，缓存在磁盘上
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+import aiofiles.os
+from fastapi import Request
+from PIL import features
+
+# 导入日志
+from logger_config import get_logger
+
+from config import (
+    IMAGE_VARIANT_FORMATS, IMAGE_VARIANT_QUALITY, IMAGE_WIDTH_BUCKETS, VARIANT_CACHE_DIR, VARIANT_CACHE_MAX_BYTES
+)
+from database import Image
+from services.backfill import read_image_content
+from services.image_cache import DiskImageCache
+from services.process_pool import run_in_process
+from services.single_flight import SingleFlight
+from utils.http_utils import accept_quality
+from utils.image_utils import transcode_image
+
+logger = get_logger(__name__)
+
+# 转码格式对应的 media type
+VARIANT_MEDIA_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+# 各原图格式可以转成的格式：GIF 可能是动图，只转动画 WebP；已是 WebP 的只转 AVIF
+TRANSCODABLE_SOURCES = {
+    "image/jpeg": ("avif", "webp"),
+    "image/png": ("avif", "webp"),
+    "image/gif": ("webp",),
+    "image/webp": ("avif",),
+}
+# 客户端不接受转码格式时，缩小的版本沿用原图格式
+ORIGINAL_FORMATS = {"image/jpeg": "jpeg", "image/png": "png", "image/gif": "gif", "image/webp": "webp"}
+FORMAT_MEDIA_TYPES = {**{fmt: media_type for media_type, fmt in ORIGINAL_FORMATS.items()}, **VARIANT_MEDIA_TYPES}
+# 最多记住多少个不再尝试生成的变体，超出后淘汰最久未用的（淘汰后最多再生成一次）
+SKIPPED_VARIANTS_LIMIT = 10000
+# 生成失败的变体多久后允许重试（秒）；不比原图小的转码结果不会变化，不再重试
+FAILED_VARIANT_RETRY_SECONDS = 300
+
+
+class ImageVariantService:
+    """派生图片的协商、生成与缓存
+
+    派生图片存放在独立的 DiskImageCache 中（共用一个字节预算），不修改原图：
+    - 原尺寸转码：键为 <文件哈希>.<格式>。未命中时本次仍返回原图，同时在后台转码，
+      之后的请求直接返回缓存的变体；转码结果不比原图小时记下并不再尝试，
+      生成失败时 FAILED_VARIANT_RETRY_SECONDS 秒内不再尝试。
+    - 按宽度缩小：键为 <文件哈希>.w<档位>.<格式>。未命中时当场生成后返回。
+    生成都在进程池中执行，同一变体的并发请求只生成一次。
+    """
+
+    def __init__(self, cache: DiskImageCache, formats: List[str], quality: int, width_buckets: List[int]):
+        self.cache = cache
+        # 只保留当前 Pillow 能编码的格式
+        self.formats = [fmt for fmt in formats if fmt in VARIANT_MEDIA_TYPES and features.check(fmt)]
+        self.quality = quality
+        self.width_buckets = width_buckets
+        self._flight = SingleFlight()
+        self._tasks: Set[asyncio.Task] = set()
+        # 暂不生成的变体键 -> 到期时间（monotonic），按最近使用顺序排列
+        self._skipped: "OrderedDict[str, float]" = OrderedDict()
+        self.transcoded = 0
+        self.downscaled = 0
+        self.skipped = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.cache.enabled and bool(self.formats)
+
+    def varies(self, mime_type: Optional[str]) -> bool:
+        """该原图的响应是否随 Accept 变化（需要 Vary: Accept）"""
+        return self.enabled and any(fmt in self.formats for fmt in TRANSCODABLE_SOURCES.get(mime_type or "", ()))
+
+    def negotiate(self, request: Request, mime_type: Optional[str]) -> List[str]:
+        """客户端可接受、且适用于该原图的转码格式，按优先级排列"""
+        if not self.enabled:
+            return []
+        allowed = TRANSCODABLE_SOURCES.get(mime_type or "", ())
+        return [
+            fmt for fmt in self.formats
+            if fmt in allowed and accept_quality(request, VARIANT_MEDIA_TYPES[fmt]) > 0
+        ]
+
+    async def lookup(self, db_image: Image, formats: List[str]) -> Optional[Dict[str, str]]:
+        """返回第一个已缓存的变体 {"path", "format", "media_type"}
+
+        首选格式尚未生成时在后台开始转码，本次返回已有的次选格式或None（由调用方返回原图）。
+        """
+        scheduled = False
+        for fmt in formats:
+            key = f"{db_image.file_hash}.{fmt}"
+            if self._is_skipped(key):
+                continue
+            path = self.cache.get(key)
+            if path and await aiofiles.os.path.exists(path):
+                return {"path": path, "format": fmt, "media_type": VARIANT_MEDIA_TYPES[fmt]}
+            if path:
+                self.cache.discard(key)
+            if not scheduled:
+                self._spawn(self._flight.do(key, lambda fmt=fmt, key=key: self._generate(db_image, fmt, key)))
+                scheduled = True
+        return None
+
+    def width_bucket(self, width: int) -> Optional[int]:
+        """请求宽度向上取整到最近的档位；超过最大档位时返回None（使用原图）"""
+        for bucket in self.width_buckets:
+            if width <= bucket:
+                return bucket
+        return None
+
+    async def resized(self, db_image: Image, width: int, formats: List[str]) -> Optional[Dict[str, str]]:
+        """返回按宽度档位缩小的变体，必要时当场生成；原图不比档位宽或生成失败时返回None
+
+        formats 为协商出的转码格式，为空时沿用原图格式。
+        """
+        bucket = self.width_bucket(width)
+        if not self.cache.enabled or bucket is None or (db_image.width and db_image.width <= bucket):
+            return None
+        candidates = [fmt for fmt in formats if not self._is_skipped(f"{db_image.file_hash}.w{bucket}.{fmt}")]
+        fmt = candidates[0] if candidates else ORIGINAL_FORMATS.get(db_image.mime_type or "")
+        if not fmt or self._is_skipped(f"{db_image.file_hash}.w{bucket}.{fmt}"):
+            return None
+
+        key = f"{db_image.file_hash}.w{bucket}.{fmt}"
+        variant = {"path": self.cache.path_for(key), "format": fmt, "media_type": FORMAT_MEDIA_TYPES[fmt], "width": bucket}
+        path = self.cache.get(key)
+        if path and await aiofiles.os.path.exists(path):
+            return variant
+        if path:
+            self.cache.discard(key)
+        # 写入后可能已被淘汰（变体大于整个缓存预算时），以文件是否存在为准
+        if await self._flight.do(key, lambda: self._generate(db_image, fmt, key, bucket)) \
+                and await aiofiles.os.path.exists(variant["path"]):
+            return variant
+        return None
+
+    def srcset(self, db_image: Image, image_url: str) -> List[Dict[str, Any]]:
+        """可直接用于 <img srcset> 的候选列表 [{"url", "width"}]：比原图窄的各档位，加上原图"""
+        if not self.cache.enabled or db_image.mime_type not in ORIGINAL_FORMATS:
+            return []
+        candidates = [
+            {"url": f"/image/checked/{db_image.id}?w={bucket}", "width": bucket}
+            for bucket in self.width_buckets
+            if not db_image.width or bucket < db_image.width
+        ]
+        if db_image.width:
+            candidates.append({"url": image_url, "width": db_image.width})
+        return candidates
+
+    async def _generate(self, db_image: Image, fmt: str, key: str, width: Optional[int] = None) -> bool:
+        content = await read_image_content(db_image)
+        if not content:
+            return False
+        try:
+            variant = await run_in_process(transcode_image, content, fmt.upper(), self.quality, width)
+        except Exception as e:
+            self.failures += 1
+            self._skip(key, time.monotonic() + FAILED_VARIANT_RETRY_SECONDS)
+            logger.warning(f"图片转码失败 - ID: {db_image.id}, 格式: {fmt}, 宽度: {width}, 错误: {e}")
+            return False
+        # 原尺寸转码不比原图小时没有意义；缩小的版本总是保留
+        if width is None and len(variant) >= len(content):
+            self.skipped += 1
+            self._skip(key, float("inf"))
+            return False
+        try:
+            await self.cache.put(key, variant)
+        except OSError as e:
+            logger.error(f"写入派生图片缓存失败: {e}")
+            return False
+        if width is None:
+            self.transcoded += 1
+        else:
+            self.downscaled += 1
+        logger.debug(f"派生图片已生成 - ID: {db_image.id}, 格式: {fmt}, 宽度: {width}, {len(content)} -> {len(variant)} 字节")
+        return True
+
+    def _is_skipped(self, key: str) -> bool:
+        expires_at = self._skipped.get(key)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            del self._skipped[key]
+            return False
+        self._skipped.move_to_end(key)
+        return True
+
+    def _skip(self, key: str, expires_at: float):
+        self._skipped[key] = expires_at
+        self._skipped.move_to_end(key)
+        while len(self._skipped) > SKIPPED_VARIANTS_LIMIT:
+            self._skipped.popitem(last=False)
+
+    async def remove(self, file_hash: Optional[str]):
+        """删除图片时清理它的全部派生图片"""
+        if not file_hash:
+            return
+        formats = set(self.formats) | set(ORIGINAL_FORMATS.values())
+        keys = [f"{file_hash}.{fmt}" for fmt in self.formats]
+        keys += [f"{file_hash}.w{bucket}.{fmt}" for bucket in self.width_buckets for fmt in formats]
+        for key in keys:
+            self._skipped.pop(key, None)
+        await self.cache.remove(keys)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "formats": self.formats,
+            "width_buckets": self.width_buckets,
+            "transcoded": self.transcoded,
+            "downscaled": self.downscaled,
+            "skipped_no_gain": self.skipped,
+            "failures": self.failures,
+            "skipped_variants": len(self._skipped),
+            "in_flight": len(self._flight),
+            "cache": self.cache.stats(),
+        }
+
+    async def stop(self):
+        """取消尚未完成的后台转码任务"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+# 创建全局派生图片缓存与服务实例
+variant_cache = DiskImageCache(VARIANT_CACHE_DIR, VARIANT_CACHE_MAX_BYTES, name="variant-cache")
+image_variant_service = ImageVariantService(
+    variant_cache, IMAGE_VARIANT_FORMATS, IMAGE_VARIANT_QUALITY, IMAGE_WIDTH_BUCKETS
+)
@@ -0,0 +1,155 @@
+# 感知哈希近似重复索引 - 进程内BK树，按汉明距离查找相似图片
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# 导入日志
+from logger_config import get_logger
+
+from config import PHASH_INDEX_RECONCILE_SECONDS
+
+logger = get_logger(__name__)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class _BKNode:
+    __slots__ = ("value", "children")
+
+    def __init__(self, value: int):
+        self.value = value
+        self.children: Dict[int, "_BKNode"] = {}
+
+
+class BKTree:
+    """汉明距离上的BK树
+
+    每个子节点按与父节点的距离挂载，查询半径为 r 时只需访问距离落在
+    [d-r, d+r] 内的子树，小半径查询只触及树的一小部分。
+    """
+
+    def __init__(self):
+        self._root: Optional[_BKNode] = None
+        self.size = 0
+
+    def insert(self, value: int):
+        if self._root is None:
+            self._root = _BKNode(value)
+            self.size = 1
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node.value)
+            if distance == 0:
+                return
+            child = node.children.get(distance)
+            if child is None:
+                node.children[distance] = _BKNode(value)
+                self.size += 1
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """返回与 value 距离不超过 max_distance 的 (值, 距离)"""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node.value)
+            if distance <= max_distance:
+                found.append((node.value, distance))
+            low, high = distance - max_distance, distance + max_distance
+            for child_distance, child in node.children.items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+        return found
+
+
+class PerceptualHashIndex:
+    """图片感知哈希索引
+
+    BK树中保存不同的哈希值，另用字典记录每个哈希对应的图片ID。
+    BK树不支持删除，删除图片时只移除ID，哈希值留在树中（查询时跳过无图片的值），
+    按固定周期与数据库对账时整体重建。
+    """
+
+    def __init__(self, reconcile_interval: int = PHASH_INDEX_RECONCILE_SECONDS):
+        self.reconcile_interval = reconcile_interval
+        self._tree = BKTree()
+        self._ids_by_hash: Dict[int, Set[int]] = {}
+        self._hash_by_id: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._hash_by_id)
+
+    def needs_reload(self) -> bool:
+        """是否需要与数据库对账"""
+        if self._loaded_at is None:
+            return True
+        return time.monotonic() - self._loaded_at >= self.reconcile_interval
+
+    def invalidate(self):
+        """标记索引失效，下次访问时强制对账"""
+        self._loaded_at = None
+
+    def reload(self, rows: Iterable[Tuple[int, str]]):
+        """用数据库中全部 (id, phash) 重建索引"""
+        tree = BKTree()
+        ids_by_hash: Dict[int, Set[int]] = {}
+        hash_by_id: Dict[int, int] = {}
+        for image_id, phash in rows:
+            value = int(phash, 16)
+            tree.insert(value)
+            ids_by_hash.setdefault(value, set()).add(image_id)
+            hash_by_id[image_id] = value
+        with self._lock:
+            self._tree = tree
+            self._ids_by_hash = ids_by_hash
+            self._hash_by_id = hash_by_id
+            self._loaded_at = time.monotonic()
+        logger.debug(f"感知哈希索引已重建 - 图片: {len(hash_by_id)}, 不同哈希: {tree.size}")
+
+    def add(self, image_id: int, phash: Optional[str]):
+        if not phash:
+            return
+        value = int(phash, 16)
+        with self._lock:
+            self._remove_locked(image_id)
+            self._tree.insert(value)
+            self._ids_by_hash.setdefault(value, set()).add(image_id)
+            self._hash_by_id[image_id] = value
+
+    def remove(self, image_id: int):
+        with self._lock:
+            self._remove_locked(image_id)
+
+    def _remove_locked(self, image_id: int):
+        value = self._hash_by_id.pop(image_id, None)
+        if value is not None:
+            ids = self._ids_by_hash.get(value)
+            if ids:
+                ids.discard(image_id)
+
+    def find_similar(self, phash: str, max_distance: int, exclude: Optional[int] = None,
+                     limit: int = 5) -> List[Dict[str, int]]:
+        """查找汉明距离不超过 max_distance 的图片，按距离升序返回 [{"id", "distance"}]"""
+        value = int(phash, 16)
+        with self._lock:
+            matches = [
+                (distance, image_id)
+                for match, distance in self._tree.search(value, max_distance)
+                for image_id in self._ids_by_hash.get(match, ())
+                if image_id != exclude
+            ]
+        matches.sort()
+        return [{"id": image_id, "distance": distance} for distance, image_id in matches[:limit]]
+
+
+# 创建全局索引实例
+phash_index = PerceptualHashIndex()
@@ -1,7 +1,8 @@
 # PicGo 服务逻辑
 import httpx
 from fastapi import HTTPException, UploadFile
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, Dict, Any, Tuple
 
 # 导入日志
@@ -9,12 +10,24 @@ from logger_config import get_logger
 
 from config import PICGO_API_URL, PICGO_API_KEY
 from database import add_image, get_image_by_hash
-from utils.image_utils import calculate_file_hash, get_image_dimensions
+from utils.upload_utils import IngestedFile, ingest_upload
 from models import PicGoUploadResponse
+from services.http_client import get_http_client
+from services.resilience import CircuitOpenError, picgo_api_breaker, resilient_request
+from services.thumbnails import thumbnail_service
 
 logger = get_logger(__name__)
 
 
+class PicGoRejectedError(HTTPException):
+    """重试也不会成功的上传失败：未配置密钥，或PicGo以4xx拒绝了请求"""
+
+
+def _is_rejection(status_code) -> bool:
+    """PicGo返回的状态码是否表示请求本身有误（4xx，超时和限流除外）"""
+    return isinstance(status_code, int) and 400 <= status_code < 500 and status_code not in (408, 429)
+
+
 class PicGoService:
     """PicGo 图床服务"""
     
@@ -25,7 +38,7 @@ class PicGoService:
     async def upload_file(
         self,
         file: UploadFile,
-        db: Session,
+        db: AsyncSession,
         api_key: Optional[str] = None,
         title: Optional[str] = None,
         description: Optional[str] = None,
@@ -37,9 +50,10 @@ class PicGoService:
         nsfw: Optional[int] = 0,
         format: Optional[str] = "json",
         use_file_date: Optional[int] = 0,
-        auto_check: bool = False
+        auto_check: bool = False,
+        ingested: Optional[IngestedFile] = None
     ) -> Dict[str, Any]:
-        """上传文件到PicGo图床"""
+        """上传文件到PicGo图床；调用方已接收过文件时传入 ingested，避免重复读取和哈希"""
         
         # 验证API密钥
         picgo_key = api_key or self.api_key
@@ -49,13 +63,13 @@ class PicGoService:
                 detail="PicGo API 密钥未设置"
             )
         
-        # 读取文件内容
-        contents = await file.read()
-        file_hash = calculate_file_hash(contents)
-        await file.seek(0)  # 重置文件指针
+        # 流式读取文件，计算哈希值和大小
+        if ingested is None:
+            ingested = await ingest_upload(file)
+        file_hash = ingested.file_hash
         
         # 检查数据库中是否已存在相同哈希值的图片
-        existing_image = get_image_by_hash(db, file_hash)
+        existing_image = await get_image_by_hash(db, file_hash)
         if existing_image:
             return {
                 "status": "success", 
@@ -65,10 +79,13 @@ class PicGoService:
                 "image_bed_url": existing_image.image_bed_url
             }
         
+        # 计算感知哈希，随记录一起入库
+        await ingested.compute_phash()
+        
         # 上传到PicGo
         try:
             result = await self._upload_to_picgo(
-                file_content=contents,
+                file_content=await ingested.body(),
                 filename=file.filename,
                 content_type=file.content_type,
                 picgo_key=picgo_key,
@@ -89,26 +106,58 @@ class PicGoService:
                 db_image = await self._save_to_database(
                     db=db,
                     image_info=result["image"],
-                    file_content=contents,
-                    file_hash=file_hash,
+                    ingested=ingested,
                     original_filename=file.filename,
                     content_type=file.content_type,
                     is_checked=auto_check
                 )
                 
                 result["database_id"] = db_image.id
+                # 上传内容复制到临时文件后交给后台生成缩略图，不整体读入内存
+                await thumbnail_service.schedule_upload(ingested)
                 if album_id:
                     result["uploaded_to_album"] = album_id
                     result["album_upload"] = True
             
             return result
             
+        except CircuitOpenError as e:
+            raise HTTPException(status_code=503, detail=f"图床暂时不可用: {e}")
         except Exception as e:
             raise HTTPException(
                 status_code=500,
                 detail=f"上传失败: {str(e)}"
             )
     
+    async def upload_local_file(
+        self,
+        file_path: str,
+        filename: str,
+        content_type: str,
+        api_key: Optional[str] = None,
+        **options
+    ) -> Dict[str, Any]:
+        """把已保存在本地的图片推送到PicGo图床（后台上传任务使用），返回PicGo的响应"""
+        picgo_key = api_key or self.api_key
+        if not picgo_key:
+            raise PicGoRejectedError(
+                status_code=500,
+                detail="PicGo API 密钥未设置"
+            )
+        
+        # 传入文件对象，由HTTP客户端分块读取，不整体读入内存；打开和关闭放到线程池
+        file = await run_in_threadpool(open, file_path, "rb")
+        try:
+            return await self._upload_to_picgo(
+                file_content=file,
+                filename=filename,
+                content_type=content_type,
+                picgo_key=picgo_key,
+                **options
+            )
+        finally:
+            await run_in_threadpool(file.close)
+    
     async def upload_from_url(
         self,
         source_url: str,
@@ -159,12 +208,11 @@ class PicGoService:
                 if value is not None:
                     data[key] = str(value)
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    self.api_url,
-                    headers=headers,
-                    data=data
-                )
+            response = await resilient_request(
+                picgo_api_breaker,
+                lambda: get_http_client().post(self.api_url, headers=headers, data=data),
+                idempotent=False
+            )
             
             if response.status_code == 200:
                 return response.json()
@@ -186,16 +234,18 @@ class PicGoService:
                 status_code=408,
                 detail="上传超时，请重试"
             )
+        except CircuitOpenError as e:
+            raise HTTPException(status_code=503, detail=f"图床暂时不可用: {e}")
     
     async def _upload_to_picgo(
         self,
-        file_content: bytes,
+        file_content,
         filename: Optional[str],
         content_type: str,
         picgo_key: str,
         **kwargs
     ) -> Dict[str, Any]:
-        """实际上传到PicGo的内部方法"""
+        """实际上传到PicGo的内部方法，file_content 为字节串或文件对象"""
         
         headers = {"X-API-Key": picgo_key}
         
@@ -214,13 +264,14 @@ class PicGoService:
         
         logger.debug(f"正在发送请求到PicGo API: {self.api_url}")
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                self.api_url,
-                headers=headers,
-                files=files,
-                data=data
-            )
+        def send():
+            # 重试时文件对象需要回到开头
+            if hasattr(file_content, "seek"):
+                file_content.seek(0)
+            return get_http_client().post(self.api_url, headers=headers, files=files, data=data)
+        
+        # 上传不是幂等操作，只重试请求未发出的连接错误；熔断时抛出 CircuitOpenError
+        response = await resilient_request(picgo_api_breaker, send, idempotent=False)
         
         logger.debug(f"PicGo API响应状态码: {response.status_code}")
         
@@ -229,7 +280,8 @@ class PicGoService:
             if result.get("status_code") == 200:
                 return result
             else:
-                raise HTTPException(
+                error_class = PicGoRejectedError if _is_rejection(result.get("status_code")) else HTTPException
+                raise error_class(
                     status_code=500,
                     detail=f"PicGo上传失败: {result.get('status_txt', '未知错误')}"
                 )
@@ -244,17 +296,17 @@ class PicGoService:
             except Exception:
                 pass
             
-            raise HTTPException(
+            error_class = PicGoRejectedError if _is_rejection(response.status_code) else HTTPException
+            raise error_class(
                 status_code=500,
                 detail=f"PicGo上传失败: {error_detail}"
             )
     
     async def _save_to_database(
         self,
-        db: Session,
+        db: AsyncSession,
         image_info: Dict[str, Any],
-        file_content: bytes,
-        file_hash: str,
+        ingested: IngestedFile,
         original_filename: Optional[str],
         content_type: str,
         is_checked: bool = False
@@ -271,28 +323,34 @@ class PicGoService:
         # 获取图片尺寸
         width = image_info.get("width", 0)
         height = image_info.get("height", 0)
-        if (width == 0 or height == 0) and file_content:
+        if (width == 0 or height == 0) and ingested.size:
             try:
-                width, height = get_image_dimensions(file_content)
-                logger.debug(f"从本地文件获取图片尺寸: {width}x{height}")
+                width, height = await ingested.dimensions()
+                logger.debug(f"从上传内容获取图片尺寸: {width}x{height}")
             except Exception as e:
                 logger.error(f"获取图片尺寸失败: {e}")
                 width, height = 0, 0
         
+        # 占位图和主色调只在入库时计算一次
+        placeholder = await ingested.compute_placeholder()
+        
         # 保存到数据库
+        file_hash = ingested.file_hash
         filename = image_info.get("filename", original_filename or f"{file_hash}.jpg")
         
-        db_image = add_image(
+        db_image = await add_image(
             db=db,
             file_name=filename,
             file_hash=file_hash,
             file_path="",  # PicGo上传不保存本地路径
             image_bed_url=image_bed_url,
             is_checked=is_checked,
-            file_size=image_info.get("size", len(file_content)),
+            file_size=image_info.get("size", ingested.size),
             mime_type=image_info.get("mime", content_type),
             width=width,
-            height=height
+            height=height,
+            phash=ingested.phash,
+            **placeholder
         )
         
         return db_image
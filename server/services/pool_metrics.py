@@ -0,0 +1,72 @@
+# 数据库连接池监控 - 记录获取连接的耗时与超时次数，用于按worker数调整连接池大小
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class PoolMetrics:
+    """连接池获取连接的统计
+
+    耗时包含排队等待空闲连接与新建连接（溢出时）的时间，
+    最近的样本保存在固定长度的窗口中用于计算分位数。
+    """
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self.acquired = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.acquired += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._recent.append(wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = sorted(self._recent)
+            attempts = self.acquired + self.timeouts
+
+            def percentile(p: float) -> float:
+                if not recent:
+                    return 0.0
+                return recent[min(len(recent) - 1, int(len(recent) * p))] * 1000
+
+            return {
+                "acquired": self.acquired,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait / attempts * 1000, 3) if attempts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "recent_p50_wait_ms": round(percentile(0.50), 3),
+                "recent_p95_wait_ms": round(percentile(0.95), 3),
+                "recent_p99_wait_ms": round(percentile(0.99), 3),
+            }
+
+
+# 创建全局统计实例
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """在获取连接时计时的连接池"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_metrics.record(time.perf_counter() - start)
+        return connection
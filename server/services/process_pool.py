@@ -0,0 +1,64 @@
+# 图片处理进程池 - 解码、缩放、转码等CPU密集操作放到子进程执行
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+# 导入日志
+from logger_config import get_logger
+
+from config import IMAGE_PROCESS_WORKERS
+
+logger = get_logger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """获取共享进程池，首次使用时创建
+
+    PIL 处理大图时长时间持有GIL，放在线程池中仍会拖慢事件循环，因此使用进程池。
+    子进程以 spawn 方式启动，不继承父进程中的事件循环、数据库连接等状态；
+    提交的函数和参数必须可以被 pickle（模块级函数、字节串等）。
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=IMAGE_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        logger.info(f"图片处理进程池已创建 - 进程数: {IMAGE_PROCESS_WORKERS}")
+    return _executor
+
+
+async def run_in_process(func: Callable[..., Any], *args: Any) -> Any:
+    """在进程池中执行 func(*args) 并等待结果
+
+    子进程异常退出（OOM、原生库崩溃）后进程池永久不可用，此时丢弃旧池，
+    下次调用时重建，并把本次任务在新池中重试一次。
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_process_pool()
+    try:
+        return await loop.run_in_executor(executor, func, *args)
+    except BrokenProcessPool:
+        _discard_broken_pool(executor)
+        return await loop.run_in_executor(get_process_pool(), func, *args)
+
+
+def _discard_broken_pool(executor: ProcessPoolExecutor):
+    global _executor
+    # 并发任务可能已由其他调用方替换为新池，只丢弃本次使用的旧池
+    if _executor is executor:
+        logger.warning("图片处理子进程异常退出，进程池将重建")
+        executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def shutdown_process_pool():
+    """关闭进程池，取消尚未开始的任务"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,182 @@
+# 上游调用的容错 - 带抖动的指数退避重试与熔断器
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+# 导入日志
+from logger_config import get_logger
+
+from config import (
+    UPSTREAM_RETRY_ATTEMPTS, UPSTREAM_RETRY_BASE_DELAY, UPSTREAM_RETRY_MAX_DELAY, UPSTREAM_RETRY_BUDGET,
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS
+)
+
+logger = get_logger(__name__)
+
+# 请求尚未发到上游的传输错误，非幂等请求也可以安全重试
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# 已等满读超时的错误，重试只会让调用方再等一个读超时
+NO_RETRY_ERRORS = (httpx.ReadTimeout,)
+# 视为上游故障、幂等请求可重试的状态码
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开期间的快速失败"""
+
+    def __init__(self, breaker: "CircuitBreaker"):
+        super().__init__(f"{breaker.name} 熔断中，{breaker.retry_after():.0f}秒后重试")
+        self.breaker = breaker
+
+
+class CircuitBreaker:
+    """熔断器
+
+    连续失败 failure_threshold 次后打开，打开期间直接拒绝请求而不再等待上游超时；
+    reset_timeout 秒后进入半开状态，每个 reset_timeout 窗口只放行一个探测请求，
+    探测成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_at: Optional[float] = None
+        # 累计计数
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == "open"
+
+    def retry_after(self) -> float:
+        """距离下次允许探测的秒数"""
+        if self._opened_at is None:
+            return 0.0
+        start = max(self._opened_at, self._probe_at or 0.0)
+        return max(self.reset_timeout - (time.monotonic() - start), 0.0)
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            now = time.monotonic()
+            if state == "half_open" and (self._probe_at is None or now - self._probe_at >= self.reset_timeout):
+                # 半开：放行一个探测请求，探测未返回前其余请求继续被拒绝
+                self._probe_at = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+            self._consecutive_failures = 0
+            if self._opened_at is not None:
+                logger.info(f"[{self.name}] 探测成功，熔断器关闭")
+            self._opened_at = None
+            self._probe_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._consecutive_failures += 1
+            half_open = self._opened_at is not None
+            if half_open or self._consecutive_failures >= self.failure_threshold:
+                if not half_open:
+                    self.trips += 1
+                    logger.warning(f"[{self.name}] 连续失败 {self._consecutive_failures} 次，熔断器打开")
+                self._opened_at = time.monotonic()
+                self._probe_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self._consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "retry_after": round(self.retry_after(), 1),
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "trips": self.trips,
+        }
+
+
+def backoff_delay(attempt: int, base: float = UPSTREAM_RETRY_BASE_DELAY,
+                  cap: float = UPSTREAM_RETRY_MAX_DELAY) -> float:
+    """第 attempt 次失败后的等待时间：全抖动指数退避，避免大量请求同时重试"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+async def resilient_request(
+    breaker: CircuitBreaker,
+    send: Callable[[], Awaitable[httpx.Response]],
+    idempotent: bool,
+    attempts: int = UPSTREAM_RETRY_ATTEMPTS,
+    budget: float = UPSTREAM_RETRY_BUDGET
+) -> httpx.Response:
+    """经熔断器发送一次上游请求，按需重试
+
+    send 为每次调用都重新发起请求的无参协程函数。请求未发出的连接错误总会重试；
+    幂等请求（GET）还会重试写超时、读写错误和 429/5xx 响应，非幂等请求（上传）不会，
+    以免重复创建。读超时不重试；累计耗时加上退避等待超过 budget 秒后也不再重试，
+    使慢上游下单次调用的总耗时有上限。
+    熔断器打开时抛出 CircuitOpenError；最终仍是 429/5xx 时返回该响应。
+    """
+    started = time.monotonic()
+    for attempt in range(1, attempts + 1):
+        if not breaker.allow_request():
+            raise CircuitOpenError(breaker)
+        try:
+            response = await send()
+        except httpx.TransportError as e:
+            breaker.record_failure()
+            delay = backoff_delay(attempt)
+            if attempt == attempts or isinstance(e, NO_RETRY_ERRORS) \
+                    or not (idempotent or isinstance(e, NOT_SENT_ERRORS)) \
+                    or time.monotonic() - started + delay > budget:
+                raise
+            logger.debug(f"[{breaker.name}] 第{attempt}次请求失败，准备重试: {e!r}")
+        else:
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            delay = backoff_delay(attempt)
+            if attempt == attempts or not idempotent or time.monotonic() - started + delay > budget:
+                return response
+            logger.debug(f"[{breaker.name}] 第{attempt}次请求返回 {response.status_code}，准备重试")
+            await response.aclose()
+        await asyncio.sleep(delay)
+    raise RuntimeError("unreachable")
+
+
+# 创建全局熔断器实例：PicGo上传接口与图床图片访问分别统计
+picgo_api_breaker = CircuitBreaker("picgo-api")
+image_bed_breaker = CircuitBreaker("image-bed")
+
+
+def breaker_stats() -> Dict[str, Any]:
+    return {breaker.name: breaker.stats() for breaker in (picgo_api_breaker, image_bed_breaker)}
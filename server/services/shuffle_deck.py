@@ -0,0 +1,95 @@
+# 随机浏览洗牌牌组 - 每位访客遍历完全部已审核图片前不会重复
+import secrets
+from typing import Callable, Optional
+
+# 每次抽牌最多跳过的空位数（已删除或未审核的ID），超出后由调用方回退到普通随机
+MAX_DECK_SKIPS = 4096
+
+_ROUNDS = 4
+_MASK64 = (1 << 64) - 1
+
+
+def _mix(value: int) -> int:
+    """splitmix64 混淆函数，作为Feistel轮函数"""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+class ShuffleDeck:
+    """由种子决定的ID排列 + 当前位置
+
+    排列通过带种子的Feistel网络在 [0, 2^k) 上构造双射，再用循环行走
+    限制到 [0, domain)，因此无需保存ID列表，每位访客的状态只有
+    (seed, domain, offset) 三个整数，可编码成一个短令牌由客户端携带。
+    位置 i 对应的图片ID为 permute(i) + 1。
+    """
+
+    def __init__(self, seed: int, domain: int, offset: int = 0):
+        self.seed = seed
+        self.domain = domain
+        self.offset = offset
+        self._half_bits = max(1, (max(domain - 1, 1).bit_length() + 1) // 2)
+        self._half_mask = (1 << self._half_bits) - 1
+
+    @classmethod
+    def new(cls, domain: int) -> "ShuffleDeck":
+        """以随机种子创建一副新牌"""
+        return cls(secrets.randbits(32), domain)
+
+    @classmethod
+    def decode(cls, token: str, max_domain: int) -> Optional["ShuffleDeck"]:
+        """从令牌恢复牌组，令牌无效时返回None
+
+        签发后最大ID的图片可能被删除，此时令牌的值域会大于当前最大ID：多出的位置
+        只是空位，抽牌时会被跳过，令牌仍然有效。令牌由客户端携带，值域远超当前最大ID
+        的令牌视为无效：伪造的巨大值域会让几乎每个位置都落在空位上，每次抽牌都要跳满
+        MAX_DECK_SKIPS 次。上限取当前最大ID的两倍再加 MAX_DECK_SKIPS：
+        正常删除留下的值域差足以容纳，伪造令牌额外制造的空位也不超过
+        当前最大ID加 MAX_DECK_SKIPS 个。
+        """
+        try:
+            seed, domain, offset = (int(part, 16) for part in token.split("."))
+        except (ValueError, AttributeError):
+            return None
+        if not 0 < domain <= max_domain * 2 + MAX_DECK_SKIPS or not 0 <= offset <= domain or seed >> 32:
+            return None
+        return cls(seed, domain, offset)
+
+    def encode(self) -> str:
+        """编码为令牌：seed.domain.offset（十六进制）"""
+        return f"{self.seed:x}.{self.domain:x}.{self.offset:x}"
+
+    @property
+    def exhausted(self) -> bool:
+        return self.offset >= self.domain
+
+    def _feistel(self, value: int) -> int:
+        left = value >> self._half_bits
+        right = value & self._half_mask
+        for round_index in range(_ROUNDS):
+            round_key = _mix((self.seed << 8) | round_index)
+            left, right = right, left ^ (_mix(right ^ round_key) & self._half_mask)
+        return (left << self._half_bits) | right
+
+    def permute(self, position: int) -> int:
+        """把位置映射到 [0, domain) 内的唯一值（循环行走）"""
+        value = self._feistel(position)
+        while value >= self.domain:
+            value = self._feistel(value)
+        return value
+
+    def draw(self, is_available: Callable[[int], bool]) -> Optional[int]:
+        """抽出下一张可用的图片ID
+
+        牌组用完或连续跳过过多空位时返回None，可通过 exhausted 区分两种情况。
+        """
+        skips = 0
+        while not self.exhausted and skips < MAX_DECK_SKIPS:
+            image_id = self.permute(self.offset) + 1
+            self.offset += 1
+            if is_available(image_id):
+                return image_id
+            skips += 1
+        return None
@@ -0,0 +1,32 @@
+# 请求合并 - 同一个键的并发调用只执行一次
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """同一个键同时只有一个调用在执行，其间到达的调用等待并共享它的结果
+
+    用于按需生成缩略图等代价高的操作：同一张图片的并发请求只生成一次。
+    共享的任务不会因为某个等待方被取消（如客户端断开）而中断。
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 所有等待方都已取消时异常无人读取，这里读取一次避免告警
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,90 @@
+# 本地图片存储 - 按文件哈希内容寻址，路径与审核状态无关
+import os
+import uuid
+from typing import Iterable, Optional
+
+import aiofiles.os
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# 导入日志
+from logger_config import get_logger
+
+from config import STORAGE_DIR
+from database import Image, get_referenced_hashes
+from utils.upload_utils import IngestedFile
+
+logger = get_logger(__name__)
+
+# MIME类型对应的扩展名
+EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/gif": "gif", "image/webp": "webp"}
+
+
+class ContentStore:
+    """内容寻址的本地图片存储
+
+    文件按 <目录>/<哈希1-2位>/<哈希3-4位>/<文件哈希>.<扩展名> 存放：路径只由内容决定，
+    不需要查找空闲文件名，每个子目录下的文件数也保持在较小的规模；
+    审核状态只记录在数据库中，通过审核时不移动文件；
+    删除图片记录后由 release 清理不再被引用的文件。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path_for(self, file_hash: str, extension: str) -> str:
+        return os.path.join(self.directory, file_hash[:2], file_hash[2:4], f"{file_hash}.{extension}")
+
+    @staticmethod
+    def extension_for(content_type: Optional[str], filename: Optional[str] = None) -> str:
+        if content_type in EXTENSIONS:
+            return EXTENSIONS[content_type]
+        extension = os.path.splitext(filename or "")[1].lstrip(".").lower()
+        return extension or "bin"
+
+    async def save(self, ingested: IngestedFile) -> str:
+        """保存上传内容并返回路径；相同内容的文件已存在时直接复用"""
+        path = self.path_for(ingested.file_hash, self.extension_for(ingested.content_type, ingested.filename))
+        if await aiofiles.os.path.exists(path):
+            return path
+
+        await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再原子替换，读取方不会看到写了一半的文件
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            await ingested.save_to(temp_path)
+            await aiofiles.os.replace(temp_path, path)
+        except Exception:
+            try:
+                await aiofiles.os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        logger.debug(f"图片已保存: {path}")
+        return path
+
+    def owns(self, path: Optional[str]) -> bool:
+        """路径是否位于存储目录中（旧版本 checked/unchecked 目录中的文件不由这里管理）"""
+        if not path:
+            return False
+        directory = os.path.abspath(self.directory)
+        return os.path.commonpath([directory, os.path.abspath(path)]) == directory
+
+    async def release(self, db: AsyncSession, images: Iterable[Image]):
+        """图片记录删除并提交后调用：删除已没有任何记录引用其哈希的存储文件"""
+        stored = [img for img in images if img.file_hash and self.owns(img.file_path)]
+        if not stored:
+            return
+        # 删除期间可能有相同内容重新上传并复用了同一文件，以数据库为准
+        referenced = await get_referenced_hashes(db, [img.file_hash for img in stored])
+        for img in stored:
+            if img.file_hash in referenced:
+                continue
+            try:
+                await aiofiles.os.remove(img.file_path)
+                logger.debug(f"图片文件已删除: {img.file_path}")
+            except FileNotFoundError:
+                pass
+
+
+# 创建全局存储实例
+content_store = ContentStore(STORAGE_DIR)
@@ -0,0 +1,138 @@
+# 缩略图服务 - 在进程池中生成固定规格的缩略图，按文件哈希存放
+import asyncio
+import os
+import tempfile
+from typing import Dict, Optional, Set, Union
+
+import aiofiles
+import aiofiles.os
+from starlette.concurrency import run_in_threadpool
+
+# 导入日志
+from logger_config import get_logger
+
+from config import THUMBNAIL_DIR, THUMBNAIL_SIZES, THUMBNAIL_QUALITY
+from database import Image
+from services.backfill import read_image_content
+from services.process_pool import run_in_process
+from services.single_flight import SingleFlight
+from utils.image_utils import render_thumbnails
+from utils.upload_utils import IngestedFile
+
+logger = get_logger(__name__)
+
+
+class ThumbnailService:
+    """缩略图生成与存储
+
+    上传时在后台一次生成全部规格；读取时发现缺失（旧图片、生成失败）再按需生成，
+    同一张图片的并发请求只生成一次。缩略图按文件哈希存放，与图片ID和审核状态无关，
+    审核通过时不需要移动。
+    """
+
+    def __init__(self, directory: str, sizes: Dict[str, int], quality: int):
+        self.directory = directory
+        self.sizes = sizes
+        self.quality = quality
+        self._flight = SingleFlight()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def path_for(self, file_hash: str, size: str) -> str:
+        return os.path.join(self.directory, size, file_hash[:2], f"{file_hash}.webp")
+
+    async def _write(self, path: str, content: bytes):
+        # 先写临时文件再原子替换，读取方不会看到写了一半的缩略图
+        directory = os.path.dirname(path)
+        await aiofiles.os.makedirs(directory, exist_ok=True)
+        fd, temp_path = await run_in_threadpool(tempfile.mkstemp, dir=directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            async with aiofiles.open(temp_path, "wb") as f:
+                await f.write(content)
+            await aiofiles.os.replace(temp_path, path)
+        except Exception:
+            await aiofiles.os.remove(temp_path)
+            raise
+
+    async def _generate(self, file_hash: str, content: Union[bytes, str, None]) -> bool:
+        if not content:
+            return False
+        try:
+            thumbnails = await run_in_process(render_thumbnails, content, self.sizes, self.quality)
+            for size, data in thumbnails.items():
+                await self._write(self.path_for(file_hash, size), data)
+        except Exception as e:
+            logger.error(f"生成缩略图失败 - 哈希: {file_hash}, 错误: {e}")
+            return False
+        logger.debug(f"缩略图已生成 - 哈希: {file_hash}")
+        return True
+
+    async def generate(self, file_hash: str, content: Union[bytes, str]) -> bool:
+        """用已有的图片内容（字节或文件路径）生成全部规格"""
+        return await self._flight.do(file_hash, lambda: self._generate(file_hash, content))
+
+    async def ensure(self, db_image: Image, size: str) -> Optional[str]:
+        """返回指定规格的缩略图路径，缺失时读取原图生成；原图不可用时返回None"""
+        if not db_image.file_hash:
+            return None
+        path = self.path_for(db_image.file_hash, size)
+        if await aiofiles.os.path.exists(path):
+            return path
+
+        async def load_and_generate():
+            return await self._generate(db_image.file_hash, await read_image_content(db_image))
+
+        if await self._flight.do(db_image.file_hash, load_and_generate):
+            return path
+        return None
+
+    async def schedule_upload(self, ingested: IngestedFile):
+        """上传内容不在本地存储中时（直接推送到图床），在后台生成缩略图
+
+        上传内容在请求结束后失效，先分块复制到临时文件，再由子进程按路径读取，
+        主进程不需要把整张图片读入内存。
+        """
+        await aiofiles.os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = await run_in_threadpool(tempfile.mkstemp, dir=self.directory, suffix=".upload")
+        os.close(fd)
+        try:
+            await ingested.save_to(temp_path)
+        except Exception:
+            await aiofiles.os.remove(temp_path)
+            raise
+        self._spawn(self._generate_from_temp(ingested.file_hash, temp_path))
+
+    async def _generate_from_temp(self, file_hash: str, temp_path: str):
+        try:
+            await self.generate(file_hash, temp_path)
+        finally:
+            await aiofiles.os.remove(temp_path)
+
+    def schedule_ensure(self, db_image: Image):
+        """审核通过时在后台补齐缺失的缩略图"""
+        self._spawn(self.ensure(db_image, next(iter(self.sizes))))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def remove(self, file_hash: Optional[str]):
+        """删除图片时清理各规格的缩略图"""
+        if not file_hash:
+            return
+        for size in self.sizes:
+            try:
+                await aiofiles.os.remove(self.path_for(file_hash, size))
+            except FileNotFoundError:
+                pass
+
+    async def stop(self):
+        """取消尚未完成的后台生成任务"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+# 创建全局缩略图服务实例
+thumbnail_service = ThumbnailService(THUMBNAIL_DIR, THUMBNAIL_SIZES, THUMBNAIL_QUALITY)
@@ -0,0 +1,227 @@
+# 后台上传任务队列 - 图片先落盘入库，再由后台worker推送到PicGo图床
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# 导入日志
+from logger_config import get_logger
+
+from config import (
+    UPLOAD_JOB_WORKERS, UPLOAD_JOB_QUEUE_SIZE, UPLOAD_JOB_MAX_ATTEMPTS,
+    UPLOAD_JOB_RETRY_BASE_SECONDS, UPLOAD_JOB_HISTORY_LIMIT, UPLOAD_JOB_CLAIM_TIMEOUT_SECONDS
+)
+from database import Image, SessionLocal, update_image_bed_url, set_upload_status, claim_pending_uploads
+from services.picgo_service import PicGoRejectedError, picgo_service
+
+logger = get_logger(__name__)
+
+
+class UploadJob:
+    """一次后台上传任务"""
+
+    def __init__(self, image_id: int, file_path: str, file_name: str, content_type: str,
+                 title: Optional[str] = None, description: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.image_id = image_id
+        self.file_path = file_path
+        self.file_name = file_name
+        self.content_type = content_type
+        self.title = title
+        self.description = description
+        self.status = "queued"  # queued / uploading / retrying / done / failed
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.image_bed_url: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    @classmethod
+    def for_image(cls, db_image: Image) -> "UploadJob":
+        """为已保存到本地、尚未推送到图床的图片创建任务"""
+        return cls(
+            image_id=db_image.id,
+            file_path=db_image.file_path,
+            file_name=db_image.file_name,
+            content_type=db_image.mime_type,
+            title=f"Meme_{db_image.file_hash[:8]}",
+            description="从Meme系统上传的图片"
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "image_id": self.image_id,
+            "file_name": self.file_name,
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_attempts": UPLOAD_JOB_MAX_ATTEMPTS,
+            "error": self.error,
+            "image_bed_url": self.image_bed_url,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    def _set_status(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.updated_at = time.time()
+
+
+class UploadJobQueue:
+    """后台上传任务队列
+
+    上传请求只负责把文件写入本地并入库，随即返回202和任务ID；
+    固定数量的worker从有界队列中取任务推送到图床，失败后按指数退避重试。
+    图片在推送完成前由本地文件提供，推送最终失败时也仍可通过本地文件访问。
+    本地文件丢失、未配置密钥或PicGo以4xx拒绝等重试也不会成功的错误直接记为失败。
+    任务详情只保存在内存中，超过 UPLOAD_JOB_HISTORY_LIMIT 个时淘汰最早的已结束任务；
+    推送状态另记在图片记录的 upload_status 上（pending/uploading/done/rejected），
+    进程重启后由 requeue_pending 认领仍未推送的图片并重新创建任务。
+    """
+
+    def __init__(self, workers: int = UPLOAD_JOB_WORKERS, max_size: int = UPLOAD_JOB_QUEUE_SIZE):
+        self.worker_count = workers
+        self.max_size = max_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._jobs: "OrderedDict[str, UploadJob]" = OrderedDict()
+        self._workers: List[asyncio.Task] = []
+
+    def is_full(self) -> bool:
+        return self._queue is None or self._queue.full()
+
+    def submit(self, job: UploadJob) -> bool:
+        """提交任务；队列已满或未启动时任务直接记为失败并返回False"""
+        self._jobs[job.id] = job
+        try:
+            if self._queue is None:
+                raise asyncio.QueueFull
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            job._set_status("failed", "上传任务队列已满")
+            return False
+        finally:
+            self._trim_history()
+        return True
+
+    def get(self, job_id: str) -> Optional[UploadJob]:
+        return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "workers": len(self._workers),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue_size": self.max_size,
+            "jobs": counts,
+        }
+
+    async def _process(self, job: UploadJob):
+        while True:
+            job.attempts += 1
+            job._set_status("uploading")
+            await self._save_status(job, "uploading")
+            try:
+                result = await picgo_service.upload_local_file(
+                    job.file_path, job.file_name, job.content_type,
+                    title=job.title, description=job.description
+                )
+                image_info = result.get("image") or {}
+                async with SessionLocal() as db:
+                    await update_image_bed_url(
+                        db, job.image_id, image_info.get("url", ""),
+                        width=image_info.get("width"), height=image_info.get("height")
+                    )
+                job.image_bed_url = image_info.get("url")
+                job._set_status("done")
+                logger.info(f"后台上传完成 - 任务: {job.id}, 图片ID: {job.image_id}")
+                return
+            except Exception as e:
+                error = getattr(e, "detail", None) or str(e)
+                permanent = isinstance(e, (PicGoRejectedError, FileNotFoundError))
+                if job.attempts >= UPLOAD_JOB_MAX_ATTEMPTS or permanent:
+                    job._set_status("failed", error)
+                    # 重试也不会成功的不再自动推送；次数用尽的留待下次启动重试
+                    await self._save_status(job, "rejected" if permanent else "pending")
+                    logger.error(f"后台上传失败，已放弃 - 任务: {job.id}, 图片ID: {job.image_id}, 错误: {error}")
+                    return
+                delay = UPLOAD_JOB_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1)
+                job._set_status("retrying", error)
+                logger.warning(f"后台上传失败，{delay:.1f}秒后重试 - 任务: {job.id}, 第{job.attempts}次, 错误: {error}")
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _save_status(job: UploadJob, status: str):
+        try:
+            async with SessionLocal() as db:
+                await set_upload_status(db, job.image_id, status)
+        except Exception as e:
+            logger.error(f"更新推送状态失败 - 图片ID: {job.image_id}, 错误: {e}")
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                job._set_status("failed", str(e))
+                logger.error(f"后台上传任务异常 - 任务: {job.id}, 错误: {e}")
+            finally:
+                self._queue.task_done()
+                self._trim_history()
+
+    def _trim_history(self):
+        # 只淘汰已结束的任务，排队和进行中的任务始终可查询
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ("done", "failed")]
+        for job_id in finished[:max(len(self._jobs) - UPLOAD_JOB_HISTORY_LIMIT, 0)]:
+            del self._jobs[job_id]
+
+    def start(self):
+        """启动worker"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def requeue_pending(self) -> int:
+        """认领仍未推送到图床的图片并重新提交任务（启动时调用），返回提交数
+
+        只处理 upload_status 为 pending、或 uploading 但超过 UPLOAD_JOB_CLAIM_TIMEOUT_SECONDS
+        没有进展的图片；认领是条件UPDATE，多个worker进程同时启动时每张图片只提交一次。
+        旧版本的纯本地图片（upload_status 为空）和被PicGo拒绝的图片不会提交。
+        队列容量不足时剩余的图片留到下次启动。
+        """
+        capacity = self.max_size - (self._queue.qsize() if self._queue else self.max_size)
+        if capacity <= 0:
+            return 0
+        stale_before = datetime.now() - timedelta(seconds=UPLOAD_JOB_CLAIM_TIMEOUT_SECONDS)
+        async with SessionLocal() as db:
+            images = await claim_pending_uploads(db, stale_before, limit=capacity)
+        submitted = 0
+        for db_image in images:
+            job = UploadJob.for_image(db_image)
+            if self.submit(job):
+                submitted += 1
+            else:
+                await self._save_status(job, "pending")
+        if submitted:
+            logger.info(f"已重新提交 {submitted} 个未完成的后台上传任务")
+        return submitted
+
+    async def stop(self):
+        """停止worker；未完成的任务对应的图片仍保留本地文件，状态改回 pending，下次启动时重新提交"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for job in self._jobs.values():
+            if job.status in ("queued", "uploading", "retrying"):
+                await self._save_status(job, "pending")
+
+
+# 创建全局任务队列实例
+upload_job_queue = UploadJobQueue()
@@ -0,0 +1,146 @@
+# 点赞/点踩写合并缓冲 - 内存中按图片聚合增量，定期批量写回数据库
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# 导入日志
+from logger_config import get_logger
+
+from config import VOTE_FLUSH_INTERVAL_SECONDS
+from database import SessionLocal, apply_vote_deltas
+from services.image_pool import checked_image_pool
+
+logger = get_logger(__name__)
+
+# 最多记住多少张图片的已知计数，超出后淘汰最久未用的（淘汰后再次投票时重新查询一次）
+KNOWN_COUNTS_LIMIT = 10000
+
+
+class VoteBuffer:
+    """点赞/点踩缓冲
+
+    投票只在内存中累加增量并立即按“数据库已知计数 + 未写回增量”作答，
+    后台任务每隔 VOTE_FLUSH_INTERVAL_SECONDS 把所有增量用一条
+    UPDATE ... SET likes = likes + :n 批量写回，关闭时再写回一次。
+    同一张热门图片的投票风暴因此只对应每个周期一次行更新，且不会丢失并发增量。
+    """
+
+    def __init__(self, flush_interval: float = VOTE_FLUSH_INTERVAL_SECONDS):
+        self.flush_interval = flush_interval
+        self._pending: Dict[int, list] = {}
+        # 正在写回的增量，写回完成前仍计入返回的计数
+        self._inflight: Dict[int, list] = {}
+        self._known: "OrderedDict[int, Tuple[int, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    def observe(self, image_id: int, likes: int, dislikes: int) -> Tuple[int, int]:
+        """记录从数据库读到的计数，返回叠加未写回增量后的计数
+
+        该图片的增量正在写回时，读到的计数可能已包含也可能不包含这批增量，
+        此时不更新已知计数（写回完成后会并入），避免重复计算。
+        """
+        with self._lock:
+            if image_id in self._inflight:
+                if image_id in self._known:
+                    return self._view_locked(image_id)
+                delta = self._pending.get(image_id, (0, 0))
+                return max((likes or 0) + delta[0], 0), max((dislikes or 0) + delta[1], 0)
+            self._known[image_id] = (likes or 0, dislikes or 0)
+            self._known.move_to_end(image_id)
+            while len(self._known) > KNOWN_COUNTS_LIMIT:
+                self._known.popitem(last=False)
+            return self._view_locked(image_id)
+
+    def view(self, image_id: int) -> Optional[Tuple[int, int]]:
+        """叠加未写回增量后的计数；未知图片返回None"""
+        with self._lock:
+            if image_id not in self._known:
+                return None
+            return self._view_locked(image_id)
+
+    def record(self, image_id: int, likes: int = 0, dislikes: int = 0) -> Tuple[int, int]:
+        """累加一次投票，返回最新计数（调用前需已 observe 过该图片）"""
+        with self._lock:
+            delta = self._pending.setdefault(image_id, [0, 0])
+            delta[0] += likes
+            delta[1] += dislikes
+            counts = self._view_locked(image_id)
+        checked_image_pool.update_score(image_id, *counts)
+        return counts
+
+    def forget(self, image_id: int):
+        """图片被删除时丢弃其计数与未写回的增量"""
+        with self._lock:
+            self._known.pop(image_id, None)
+            self._pending.pop(image_id, None)
+
+    def _view_locked(self, image_id: int) -> Tuple[int, int]:
+        likes, dislikes = self._known.get(image_id, (0, 0))
+        for deltas in (self._inflight, self._pending):
+            delta = deltas.get(image_id)
+            if delta:
+                likes, dislikes = likes + delta[0], dislikes + delta[1]
+        return max(likes, 0), max(dislikes, 0)
+
+    async def flush(self):
+        """把累积的增量批量写回数据库"""
+        with self._lock:
+            if self._inflight or not self._pending:
+                return
+            deltas = self._inflight = self._pending
+            self._pending = {}
+
+        applied = False
+        try:
+            async with SessionLocal() as db:
+                await apply_vote_deltas(db, deltas)
+            applied = True
+        except Exception as e:
+            logger.error(f"写回投票增量失败，将在下次重试: {e}")
+        finally:
+            # 失败或被取消时把增量放回缓冲，由下次写回（含关闭时的最后一次）处理
+            with self._lock:
+                for image_id, (likes, dislikes) in deltas.items():
+                    if applied:
+                        # 增量已进入数据库，并入已知计数
+                        if image_id in self._known:
+                            known_likes, known_dislikes = self._known[image_id]
+                            self._known[image_id] = (known_likes + likes, known_dislikes + dislikes)
+                    else:
+                        delta = self._pending.setdefault(image_id, [0, 0])
+                        delta[0] += likes
+                        delta[1] += dislikes
+                self._inflight = {}
+        if applied:
+            logger.debug(f"已写回 {len(deltas)} 张图片的投票增量")
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    def start(self):
+        """启动后台写回任务"""
+        if self._task is None:
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并写回剩余增量
+
+        不取消后台任务，而是等待正在进行的写回完成，再写回剩余增量。
+        """
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+# 创建全局投票缓冲实例
+vote_buffer = VoteBuffer()
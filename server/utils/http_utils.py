@@ -0,0 +1,96 @@
+# HTTP 条件请求与本地文件响应工具
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+import aiofiles.os
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+
+def file_etag(file_hash: Optional[str]) -> Optional[str]:
+    """由文件MD5生成强ETag；同一哈希对应的内容不会变化"""
+    return f'"{file_hash}"' if file_hash else None
+
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    """If-None-Match 是否命中（按RFC 7232使用弱比较）"""
+    if_none_match = request.headers.get("if-none-match")
+    if not etag or not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag == etag or tag == f"W/{etag}" for tag in candidates)
+
+
+def accept_quality(request: Request, media_type: str) -> float:
+    """Accept 中明确列出的 media_type 的q值，未列出时为0
+
+    只认完整类型，不认 image/* 和 */*：浏览器对所有图片请求都会带通配符，
+    不能据此判断它支持 AVIF/WebP。
+    """
+    for item in request.headers.get("accept", "").split(","):
+        name, _, params = item.partition(";")
+        if name.strip().lower() != media_type:
+            continue
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    return float(value)
+                except ValueError:
+                    return 0.0
+        return 1.0
+    return 0.0
+
+
+def not_modified_since(request: Request, mtime: float) -> bool:
+    """If-Modified-Since 是否不早于文件修改时间（仅在没有 If-None-Match 时使用）"""
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since or "if-none-match" in request.headers:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= since
+
+
+def not_modified_response(etag: Optional[str], headers: dict, last_modified: Optional[str] = None) -> Response:
+    """304 响应，保留缓存相关的响应头
+
+    Vary 必须保留：共享缓存据此判断304对应的是哪个协商出的表示。
+    """
+    response_headers = {
+        k: v for k, v in headers.items() if k.lower() in ("cache-control", "vary", "content-location")
+    }
+    if etag:
+        response_headers["etag"] = etag
+    if last_modified:
+        response_headers["last-modified"] = last_modified
+    return Response(status_code=304, headers=response_headers)
+
+
+async def local_file_response(
+    request: Request,
+    path: str,
+    media_type: Optional[str],
+    file_hash: Optional[str],
+    headers: dict
+) -> Response:
+    """返回本地文件，支持 If-None-Match/If-Modified-Since 的304和字节 Range 请求
+
+    文件由 FileResponse 分块发送（文件读取在线程池中执行，ASGI服务器支持
+    pathsend 扩展时直接交给服务器零拷贝发送），不会在事件循环中整块读入内存。
+    """
+    stat_result = await aiofiles.os.stat(path)
+    etag = file_etag(file_hash)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+
+    if etag_matches(request, etag) or not_modified_since(request, stat_result.st_mtime):
+        return not_modified_response(etag, headers, last_modified)
+
+    headers = {k: v for k, v in headers.items() if k.lower() != "etag"}
+    if etag:
+        headers["etag"] = etag
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
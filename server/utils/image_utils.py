@@ -1,10 +1,12 @@
 # 图片处理工具
+import base64
 import hashlib
 import os
 import shutil
+import struct
 from io import BytesIO
-from PIL import Image as PILImage
-from typing import Tuple
+from PIL import Image as PILImage, ImageOps, ImageSequence
+from typing import BinaryIO, Dict, Optional, Tuple, Union
 
 # 导入日志
 from logger_config import get_logger
@@ -13,17 +15,199 @@ from config import EXAMPLE_IMAGE_PATH, IMAGES_DIR
 
 logger = get_logger(__name__)
 
+# dHash 边长，8x8 比较得到64位哈希
+DHASH_SIZE = 8
 
-def get_image_dimensions(image_content: bytes) -> Tuple[int, int]:
-    """从图片二进制数据获取宽度和高度"""
+# 低清占位图的最长边与 WebP 质量，编码后只有几百字节，由前端拉伸并模糊显示
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 40
+
+# 带尺寸信息的 JPEG SOF 段标记（排除 DHT/JPG/DAC）
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# 没有长度字段的 JPEG 独立标记
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+
+def get_image_dimensions(image_content: Union[bytes, BinaryIO]) -> Tuple[int, int]:
+    """从图片二进制数据或文件对象获取宽度和高度（只解析文件头，不解码像素）"""
     try:
-        with PILImage.open(BytesIO(image_content)) as img:
+        source = BytesIO(image_content) if isinstance(image_content, (bytes, bytearray)) else image_content
+        with PILImage.open(source) as img:
             return img.size  # 返回 (width, height)
     except Exception as e:
         logger.error(f"获取图片尺寸失败: {e}")
         return (0, 0)
 
 
+def _probe_jpeg(head: bytes) -> Optional[Tuple[int, int]]:
+    # 逐段跳过，直到遇到 SOF 段；EXIF 缩略图很大时 SOF 可能不在 head 内，返回None
+    offset = 2
+    while offset + 4 <= len(head):
+        if head[offset] != 0xFF:
+            return None
+        marker = head[offset + 1]
+        if marker == 0xFF:  # 填充字节
+            offset += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if offset + 9 > len(head):
+                return None
+            height, width = struct.unpack(">HH", head[offset + 5:offset + 9])
+            return width, height
+        if marker in (0xD9, 0xDA):  # 已到图像数据，没有SOF
+            return None
+        offset += 2 + struct.unpack(">H", head[offset + 2:offset + 4])[0]
+    return None
+
+
+def _probe_webp(head: bytes) -> Optional[Tuple[int, int]]:
+    chunk = head[12:16]
+    if chunk == b"VP8 " and len(head) >= 30 and head[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(head) >= 25 and head[20] == 0x2F:
+        bits = int.from_bytes(head[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(head) >= 30:
+        return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+    return None
+
+
+def probe_image_dimensions(head: bytes) -> Optional[Tuple[int, int]]:
+    """只解析文件开头的字节获取 (宽度, 高度)，支持 JPEG/PNG/GIF/WebP
+
+    不创建PIL对象也不解码，可以直接在事件循环中调用；格式不支持或头部不完整时返回None，
+    由调用方回退到 get_image_dimensions。
+    """
+    try:
+        if head[:3] == b"\xff\xd8\xff":
+            return _probe_jpeg(head)
+        if head[:8] == b"\x89PNG\r\n\x1a\n" and head[12:16] == b"IHDR":
+            return struct.unpack(">II", head[16:24])
+        if head[:6] in (b"GIF87a", b"GIF89a") and len(head) >= 10:
+            return struct.unpack("<HH", head[6:10])
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return _probe_webp(head)
+    except struct.error:
+        pass
+    return None
+
+
+def compute_dhash(image_content: Union[bytes, BinaryIO]) -> Optional[str]:
+    """计算64位差值哈希（dHash），返回16位十六进制字符串；无法解析时返回None
+
+    缩成9x8灰度图后比较每行相邻像素的明暗，重新编码、缩放或截图后的同一张图
+    哈希值的汉明距离通常只有个位数。
+    """
+    try:
+        source = BytesIO(image_content) if isinstance(image_content, (bytes, bytearray)) else image_content
+        with PILImage.open(source) as img:
+            # JPEG 直接按比例缩小解码，避免解码整张大图
+            img.draft("L", (DHASH_SIZE * 8, DHASH_SIZE * 8))
+            small = img.convert("L").resize((DHASH_SIZE + 1, DHASH_SIZE), PILImage.LANCZOS)
+        pixels = list(small.getdata())
+    except Exception as e:
+        logger.error(f"计算感知哈希失败: {e}")
+        return None
+
+    bits = 0
+    for row in range(DHASH_SIZE):
+        offset = row * (DHASH_SIZE + 1)
+        for col in range(DHASH_SIZE):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:016x}"
+
+
+def compute_placeholder(image_content: Union[bytes, BinaryIO]) -> Optional[Dict[str, str]]:
+    """计算低清占位图（base64 WebP data URI）和主色调（#rrggbb）；无法解析时返回None"""
+    try:
+        source = BytesIO(image_content) if isinstance(image_content, (bytes, bytearray)) else image_content
+        with PILImage.open(source) as img:
+            img.draft("RGB", (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+            img.seek(0)
+            small = ImageOps.exif_transpose(img).convert("RGB")
+        small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), PILImage.LANCZOS)
+        output = BytesIO()
+        small.save(output, "WEBP", quality=PLACEHOLDER_QUALITY)
+        # 量化成少量颜色后取像素最多的一种作为主色调
+        quantized = small.quantize(colors=4)
+        _, index = max(quantized.getcolors())
+        red, green, blue = quantized.getpalette()[index * 3:index * 3 + 3]
+    except Exception as e:
+        logger.error(f"计算占位图失败: {e}")
+        return None
+    return {
+        "placeholder": "data:image/webp;base64," + base64.b64encode(output.getvalue()).decode("ascii"),
+        "dominant_color": f"#{red:02x}{green:02x}{blue:02x}",
+    }
+
+
+def render_thumbnails(image_content: Union[bytes, str], sizes: Dict[str, int], quality: int) -> Dict[str, bytes]:
+    """按各规格的最长边生成 WebP 缩略图，返回 {规格名: 图片字节}
+
+    image_content 为图片字节或文件路径。只解码一次，从大到小依次缩放；动图只取第一帧，按 EXIF 方向摆正。
+    在进程池中调用，因此只接收和返回可 pickle 的参数。
+    """
+    source = BytesIO(image_content) if isinstance(image_content, (bytes, bytearray)) else image_content
+    with PILImage.open(source) as img:
+        # JPEG 按比例缩小解码，最大规格保留两倍余量以保证缩放质量
+        img.draft("RGB", (max(sizes.values()) * 2,) * 2)
+        img.seek(0)
+        frame = ImageOps.exif_transpose(img)
+        has_alpha = frame.mode in ("RGBA", "LA", "PA") or "transparency" in frame.info
+        frame = frame.convert("RGBA" if has_alpha else "RGB")
+
+    thumbnails = {}
+    for name, side in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+        frame.thumbnail((side, side), PILImage.LANCZOS)
+        output = BytesIO()
+        frame.save(output, "WEBP", quality=quality, method=4)
+        thumbnails[name] = output.getvalue()
+    return thumbnails
+
+
+def _resize_to_width(frame: PILImage.Image, width: int) -> PILImage.Image:
+    if frame.width <= width:
+        return frame
+    height = max(1, round(frame.height * width / frame.width))
+    return frame.resize((width, height), PILImage.LANCZOS)
+
+
+def transcode_image(image_content: bytes, fmt: str, quality: int, width: Optional[int] = None) -> bytes:
+    """把图片转码为 fmt（"WEBP"/"AVIF"/"JPEG"/"PNG"/"GIF"），给出 width 时按比例缩小到该宽度
+
+    动图逐帧处理，保留帧时长和循环（只能输出 WebP 或 GIF）；静态图按 EXIF 方向摆正后
+    再编码（结果不保留 EXIF）。在进程池中调用。
+    """
+    output = BytesIO()
+    with PILImage.open(BytesIO(image_content)) as img:
+        if getattr(img, "is_animated", False):
+            if fmt not in ("WEBP", "GIF"):
+                raise ValueError(f"{fmt} 不支持动图")
+            if width is None:
+                img.save(output, fmt, save_all=True, quality=quality, method=4)
+            else:
+                frames, durations = [], []
+                for frame in ImageSequence.Iterator(img):
+                    durations.append(frame.info.get("duration", 100))
+                    frames.append(_resize_to_width(frame.convert("RGBA"), width))
+                frames[0].save(
+                    output, fmt, save_all=True, append_images=frames[1:],
+                    duration=durations, loop=img.info.get("loop", 0), quality=quality
+                )
+        else:
+            frame = ImageOps.exif_transpose(img)
+            has_alpha = fmt != "JPEG" and (frame.mode in ("RGBA", "LA", "PA") or "transparency" in frame.info)
+            frame = frame.convert("RGBA" if has_alpha else "RGB")
+            if width is not None:
+                frame = _resize_to_width(frame, width)
+            frame.save(output, fmt, quality=quality)
+    return output.getvalue()
+
+
 def calculate_file_hash(content: bytes) -> str:
     """计算文件的MD5哈希值"""
     return hashlib.md5(content).hexdigest()
@@ -42,25 +226,10 @@ def create_safe_filename(filename: str, file_hash: str = "") -> str:
     return safe_filename
 
 
-def get_unique_filepath(base_path: str) -> str:
-    """如果文件已存在，添加数字后缀获取唯一路径"""
-    if not os.path.exists(base_path):
-        return base_path
-    
-    counter = 1
-    name, ext = os.path.splitext(base_path)
-    while True:
-        new_path = f"{name}_{counter}{ext}"
-        if not os.path.exists(new_path):
-            return new_path
-        counter += 1
-
-
 def ensure_directories():
     """确保必要的目录存在"""
-    from config import CHECKED_DIR, UNCHECKED_DIR
-    os.makedirs(CHECKED_DIR, exist_ok=True)
-    os.makedirs(UNCHECKED_DIR, exist_ok=True)
+    from config import STORAGE_DIR
+    os.makedirs(STORAGE_DIR, exist_ok=True)
 
 
 def setup_example_image():
@@ -0,0 +1,119 @@
+# 上传文件接收工具 - 单次流式读取上传文件，同时计算哈希和大小
+import hashlib
+import tempfile
+from typing import Dict, Optional, Tuple
+
+import aiofiles
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from config import MAX_FILE_SIZE, UPLOAD_CHUNK_SIZE, UPLOAD_SPOOL_MAX_SIZE
+from utils.image_utils import compute_dhash, compute_placeholder, get_image_dimensions, probe_image_dimensions
+
+
+class IngestedFile:
+    """已接收的上传文件
+
+    内容仍保存在 UploadFile 自带的临时文件中（超过 UPLOAD_SPOOL_MAX_SIZE 时在磁盘上），
+    这里只记录流式读取时顺带得到的MD5、大小和文件头部字节，后续环节不必再整体读入或重复哈希。
+    """
+
+    def __init__(self, upload: UploadFile, file_hash: str, size: int, head: bytes):
+        self.upload = upload
+        self.file_hash = file_hash
+        self.size = size
+        # 文件开头的若干字节，用于识别格式、读取尺寸等只需文件头的场景
+        self.head = head
+        # 感知哈希，调用 compute_phash 后才有值
+        self.phash: Optional[str] = None
+        # 占位图和主色调，调用 compute_placeholder 后才有值
+        self.placeholder: Optional[Dict[str, str]] = None
+
+    @property
+    def filename(self) -> Optional[str]:
+        return self.upload.filename
+
+    @property
+    def content_type(self) -> Optional[str]:
+        return self.upload.content_type
+
+    async def compute_phash(self) -> Optional[str]:
+        """计算感知哈希（在线程池中解码），结果缓存在 phash 上"""
+        if self.phash is None:
+            await self.upload.seek(0)
+            self.phash = await run_in_threadpool(compute_dhash, self.upload.file)
+            await self.upload.seek(0)
+        return self.phash
+
+    async def compute_placeholder(self) -> Dict[str, str]:
+        """计算低清占位图和主色调（在线程池中解码），返回可直接传给 add_image 的字段"""
+        if self.placeholder is None:
+            await self.upload.seek(0)
+            self.placeholder = await run_in_threadpool(compute_placeholder, self.upload.file) or {}
+            await self.upload.seek(0)
+        return self.placeholder
+
+    async def dimensions(self) -> Tuple[int, int]:
+        """获取图片宽高：先只解析文件头，解析不出时才在线程池中用PIL读取"""
+        size = probe_image_dimensions(self.head)
+        if size:
+            return size
+        await self.upload.seek(0)
+        size = await run_in_threadpool(get_image_dimensions, self.upload.file)
+        await self.upload.seek(0)
+        return size
+
+    def detach(self):
+        """接管上传内容所在的临时文件，使其在请求结束后仍可读取（不复制内容），用完后需调用 close()"""
+        upload = self.upload
+        self.upload = UploadFile(
+            file=upload.file, size=upload.size, filename=upload.filename, headers=upload.headers
+        )
+        # 请求结束时框架会关闭原 UploadFile，给它换上一个空的占位文件
+        upload.file = tempfile.SpooledTemporaryFile()
+
+    async def close(self):
+        await self.upload.close()
+
+    async def save_to(self, path: str):
+        """把上传内容分块写入本地文件"""
+        await self.upload.seek(0)
+        async with aiofiles.open(path, "wb") as f:
+            while True:
+                chunk = await self.upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await f.write(chunk)
+        await self.upload.seek(0)
+
+    async def body(self):
+        """用于转发的请求体：小文件返回字节串，大文件返回已回到开头的文件对象（由HTTP客户端分块读取）"""
+        await self.upload.seek(0)
+        if self.size <= UPLOAD_SPOOL_MAX_SIZE:
+            return await self.upload.read()
+        return self.upload.file
+
+
+async def ingest_upload(upload: UploadFile, max_size: int = MAX_FILE_SIZE) -> IngestedFile:
+    """分块读取上传文件，增量计算MD5与大小；超过 max_size 时立即返回413"""
+    md5 = hashlib.md5()
+    size = 0
+    head = b""
+
+    await upload.seek(0)
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_size:
+            raise HTTPException(
+                status_code=413,
+                detail=f"文件过大，最大允许 {max_size / (1024 * 1024):g}MB"
+            )
+        md5.update(chunk)
+        if not head:
+            head = chunk
+
+    await upload.seek(0)
+    return IngestedFile(upload, md5.hexdigest(), size, head)
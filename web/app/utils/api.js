@@ -46,12 +46,24 @@ export function getImageUrl(path) {
   return `${API_CONFIG.baseURL}${path}`
 }
 
-// 预加载图片
-export function preloadImage(url) {
+// 由后端返回的 srcset 候选列表（[{ url, width }]）拼接 <img srcset>
+export function buildSrcset(candidates) {
+  if (!candidates || !candidates.length) return ''
+  return candidates
+    .map(({ url, width }) => `${/^https?:\/\//.test(url) ? url : getImageUrl(url)} ${width}w`)
+    .join(', ')
+}
+
+// 预加载图片（传入 srcset/sizes 时浏览器按同样的规则选择候选，与正式显示时一致）
+export function preloadImage(url, srcset = '', sizes = '') {
   return new Promise((resolve, reject) => {
     const img = new Image()
     img.onload = () => resolve(img)
     img.onerror = reject
+    if (srcset) {
+      img.sizes = sizes
+      img.srcset = srcset
+    }
     img.src = url
   })
 }